@@ -0,0 +1,11 @@
+import importlib
+
+
+def lazy_model(package: str):
+    """ Module __getattr__ of an algorithm package, which imports the
+        package's Model (and its dependencies) when first accessed """
+    def __getattr__(name: str):
+        if name == 'Model':
+            return importlib.import_module(f'{package}.model').Model
+        raise AttributeError(f"module '{package}' has no attribute '{name}'")
+    return __getattr__
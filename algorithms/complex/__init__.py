@@ -1,5 +1,4 @@
-from .model import Model
-
+from algorithms import lazy_model
 ALGORITHM_NAME = 'complex'
 ALGORITHM_PARAMS = {
     'step': {
@@ -7,5 +6,50 @@ ALGORITHM_PARAMS = {
         'required': False,
         'default': 1.0,
         'help': 'Separation between segmentation lines. Lower values mean higher precission.'
+    },
+    'refine': {
+        'type': str,
+        'required': False,
+        'default': 'array',
+        'choices': ['array', 'loop', 'parallel'],
+        'help': 'How polygons are refined by each view: all at once with the shapely '
+            'array functions (array), one by one (loop) or by chunks of planes in '
+            '-j worker processes (parallel).'
+    },
+    'merge': {
+        'type': str,
+        'required': False,
+        'default': 'none',
+        'choices': ['none', 'union'],
+        'help': 'Union the touching polygons of every plane before refining them (union).'
+    },
+    'slicing': {
+        'type': str,
+        'required': False,
+        'default': 'uniform',
+        'choices': ['uniform', 'adaptive'],
+        'help': 'Place a plane every step (uniform), or only where the view polygons '
+            'change, choosing among the lines every step (adaptive).'
+    },
+    'tolerance': {
+        'type': float,
+        'required': False,
+        'default': None,
+        'help': 'Largest error of the adaptive slicing: distance between the skipped '
+            'lines and their interpolation from the kept ones (default: step / 4).'
+    },
+    'max_planes': {
+        'type': int,
+        'required': False,
+        'default': 0,
+        'help': 'Most lines kept by the adaptive slicing (0: no limit).'
+    },
+    'max_gap': {
+        'type': int,
+        'required': False,
+        'default': 4,
+        'help': 'Most steps between two lines kept by the adaptive slicing (0: no limit).'
     }
-}
\ No newline at end of file
+}
+
+__getattr__ = lazy_model(__name__)
@@ -1,22 +1,49 @@
-import pyray as rl
 import numpy as np
+import shapely
+from pathlib import Path
 from shapely import Polygon
 from algorithms.complex.view import View
+from utils.planes import PlaneStore, lift_rings
+from utils.arrays import ragged_arange
+from algorithms.complex.slicing import interval_table, select_lines
 from core.base_model import BaseModel
+from core import profiler
 import utils.geo3d as geo3d
 
 
 class Model(BaseModel):
 
-    """ basically [key] -> (plane_point, plane_normal, polygons_in_plane) """
-    planes: dict[float, tuple[np.ndarray, np.ndarray, list[list[np.ndarray]]]]
+    """ planes: the polygons of every plane (key, point and normal) """
+    planes: PlaneStore
 
-    def __init__(self, path: str, step: float):
-        self.planes = {}
+    def __init__(self, path: str, step: float, refine: str = 'array',
+        merge: str = 'none', slicing: str = 'uniform', tolerance: float | None = None,
+        max_planes: int = 0, max_gap: int = 4, **kwargs):
+        if refine not in ('array', 'loop', 'parallel'):
+            raise ValueError(f'Unknown refinement mode: {refine}')
+        if merge not in ('none', 'union'):
+            raise ValueError(f'Unknown merge mode: {merge}')
+        if merge == 'union' and refine == 'loop':
+            raise ValueError('Merged planes need the array or parallel refinement')
+        if slicing not in ('uniform', 'adaptive'):
+            raise ValueError(f'Unknown slicing mode: {slicing}')
+        if max_planes < 0:
+            raise ValueError('The maximum number of planes must be positive (or 0)')
+        if max_gap < 0:
+            raise ValueError('The maximum gap between planes must be positive (or 0)')
+        self.planes = PlaneStore.empty()
         self.edges = []
         self.step = step
+        self.refine = refine
+        self.merge = merge
+        self.merge_counts = None
+        self.slicing = slicing
+        self.tolerance = step / 4 if tolerance is None else tolerance
+        self.max_planes = max_planes
+        self.max_gap = max_gap
+        self.slicing_counts = None
         self.planes_normal = geo3d.Axis.Null
-        super().__init__(path, View)
+        super().__init__(path, View, **kwargs)
 
 
     def initial_reconstruction(self):
@@ -50,46 +77,72 @@ class Model(BaseModel):
         max_z = max(bounds1[3], bounds2[3])
         bounds = (min_x, min_z, max_x, max_z)
 
-        segments1 = view1.rasterization_segments(line_point, line_dir, self.step, bounds)
-        segments2 = view2.rasterization_segments(line_point, line_dir, self.step, bounds)
-
         # Calculate the axis aligned with the common line
         abs_dir = np.abs(line_dir)
         axis_idx = int(np.argmax(abs_dir))
 
+        lines1 = lines2 = None
+        if self.slicing == 'adaptive':
+            with profiler.stage('adaptive_slicing'):
+                lines1, lines2 = self.adaptive_lines(view1, view2,
+                    line_point, line_dir, bounds, axis_idx)
+
+        segments1 = view1.rasterization_segments(line_point, line_dir, self.step, bounds, lines1)
+        segments2 = view2.rasterization_segments(line_point, line_dir, self.step, bounds, lines2)
+
         # direction vectors
         d1 = view1.vy
         d2 = view2.vz
         plane_normal = line_dir
 
-        # pregroup segments by their axis-aligned
-        segments2_dict: dict[float, list] = {}
-        for seg in segments2:
-            src = view2.plane_to_real(seg[0])
-            dst = view2.plane_to_real(seg[1])
-            key = round(float(src[axis_idx]), 6)
-            segments2_dict.setdefault(key, []).append((src, dst))
-
-        for segment1 in segments1:
-            # get segment1 end points
-            src1 = view1.plane_to_real(segment1[0])
-            dst1 = view1.plane_to_real(segment1[1])
-            key = round(float(src1[axis_idx]), 6)
-
-            if key not in self.planes:
-                self.planes[key] = (src1, plane_normal, [])
-
-            # get poly list and coplanar segments2
-            polygon_list = self.planes[key][2]
-            matching = segments2_dict.get(key, [])
-
-            for (src2, dst2) in matching:
-                polygon_list.append([
-                    geo3d.intersect_lines(src1, d1, src2, d2),
-                    geo3d.intersect_lines(src1, d1, dst2, d2),
-                    geo3d.intersect_lines(dst1, d1, dst2, d2),
-                    geo3d.intersect_lines(dst1, d1, src2, d2),
-                ])
+        # segment end points in space, (n, 2, 3)
+        ends1 = view1.plane_to_real_batch(segments1).reshape(-1, 2, 3)
+        ends2 = view2.plane_to_real_batch(segments2).reshape(-1, 2, 3)
+
+        # segments are grouped by the plane (key) of their axis-aligned
+        # coordinate. Pair every segment1 with the segments2 of its plane
+        keys1 = [round(v, 6) for v in ends1[:, 0, axis_idx].tolist()]
+        keys2 = [round(v, 6) for v in ends2[:, 0, axis_idx].tolist()]
+        keys, group = np.unique(np.array(keys1 + keys2, dtype=float), return_inverse=True)
+        group1, group2 = group[:len(keys1)], group[len(keys1):]
+
+        order2 = np.argsort(group2, kind='stable')
+        first2 = np.searchsorted(group2[order2], np.arange(len(keys)))
+        count2 = np.bincount(group2, minlength=len(keys))
+        matches = count2[group1]
+        pair1 = np.repeat(np.arange(len(keys1)), matches)
+        pair2 = order2[ragged_arange(first2[group1], matches)]
+
+        # quad corners: both ends of segment1 along d1, crossing both
+        # ends of segment2 along d2
+        src1, dst1 = ends1[pair1, 0], ends1[pair1, 1]
+        src2, dst2 = ends2[pair2, 0], ends2[pair2, 1]
+        quads = geo3d.intersect_lines_batch(
+            np.stack([src1, src1, dst1, dst1], axis=1), d1,
+            np.stack([src2, dst2, dst2, src2], axis=1), d2)
+
+        # planes in order of appearance, with their quads in pair order
+        _, first1, rank = np.unique(group1, return_index=True, return_inverse=True)
+        appearance = np.argsort(first1, kind='stable')
+        plane_of = np.empty(len(first1), dtype=np.int64)
+        plane_of[appearance] = np.arange(len(first1))
+        plane_index = plane_of[rank[pair1]]
+        order = np.argsort(plane_index, kind='stable')
+
+        self.planes = PlaneStore(
+            keys=np.array(keys1, dtype=float)[first1[appearance]],
+            points=ends1[first1[appearance], 0],
+            normals=np.tile(plane_normal, (len(first1), 1)),
+            vertices=quads[order].reshape(-1, 3),
+            offsets=np.arange(0, 4 * len(order) + 1, 4),
+            plane_index=plane_index[order])
+
+        profiler.count(segments=len(segments1) + len(segments2), planes=len(self.planes),
+            polygons=self.planes.n_polygons)
+
+        if self.merge == 'union':
+            with profiler.stage('merge_planes'):
+                self.merge_planes()
 
         # delete used views
         self.views.pop(view2_index)
@@ -97,58 +150,298 @@ class Model(BaseModel):
         return self
 
 
+    def adaptive_lines(self, view1: View, view2: View, line_point, line_dir,
+        bounds, axis: int) -> tuple:
+        """ Lines of both views, among the ones every step that cut the same
+            plane, where the view polygons change: every line where the
+            number of intervals of a view changes, or their ends move by
+            more than tolerance, and the one before it, and enough lines in
+            between for the interval ends to be within tolerance of a linear
+            interpolation, at most max_gap steps apart (see select_lines) """
+        sweeps = [view.scanlines(line_point, line_dir, self.step, bounds)
+            for view in (view1, view2)]
+        if None in sweeps:
+            return None, None
+
+        # planes (keys) of the lines of every view
+        keys = []
+        for (view, (horizontal, lines)) in zip((view1, view2), sweeps):
+            zeros = np.zeros_like(lines)
+            points = np.stack([zeros, lines] if horizontal else [lines, zeros], axis=1)
+            keys.append([round(v, 6) for v in view.plane_to_real_batch(points)[:, axis].tolist()])
+        line2 = {key: i for (i, key) in enumerate(keys[1])}
+        common1 = np.array([i for (i, key) in enumerate(keys[0]) if key in line2], dtype=np.int64)
+        common2 = np.array([line2[keys[0][i]] for i in common1], dtype=np.int64)
+
+        counts, ends = [], []
+        for (view, (horizontal, lines), common) in zip((view1, view2), sweeps, (common1, common2)):
+            rows, start, end = view.line_intervals(horizontal, lines[common])
+            view_counts, view_ends = interval_table(rows, start, end, len(common))
+            counts.append(view_counts)
+            ends.append(view_ends)
+
+        kept = select_lines(np.stack(counts, axis=1), np.concatenate(ends, axis=1),
+            self.tolerance, self.max_planes, self.max_gap)
+        self.slicing_counts = (len(common1), len(kept))
+        profiler.count(lines_candidate=len(common1), lines_kept=len(kept))
+        return sweeps[0][1][common1[kept]], sweeps[1][1][common2[kept]]
+
+
     def refine_model(self):
         """ Reconstructs the model directly """
         if not self.planes:
             return
 
         # get aligned axis from the model's plane normal
-        _, (_, first_normal, _) = next(iter(self.planes.items()))
+        first_normal = self.planes.normals[0]
         axis_index = int(np.argmax(np.abs(first_normal)))
         plane_axis = [geo3d.Axis.X, geo3d.Axis.Y, geo3d.Axis.Z][axis_index]
 
-        for view in self.views:
-            # ensure alignment between the view's direction and the planes
-            if np.linalg.norm(np.cross(view.vy, first_normal)) > 1e-6: continue
+        # ensure alignment between the view's direction and the planes
+        aligned = [view for view in self.views
+            if np.linalg.norm(np.cross(view.vy, first_normal)) <= 1e-6]
+
+        if self.refine == 'parallel' and self.jobs > 1 and self.planes.n_polygons and aligned:
+            with profiler.stage('refine_parallel', views=len(aligned), jobs=self.jobs):
+                self.refine_parallel([Polygon(view.polygon_view_to_plane(plane_axis))
+                    for view in aligned], axis_index)
+            return self
+
+        for view in aligned:
             poly_view_transform = Polygon(view.polygon_view_to_plane(plane_axis))
 
-            for (key, (plane_point, plane_normal, polygons)) in self.planes.items():
-                refined_polygons = []
-                for polygon3d in polygons:
+            with profiler.stage('refine_view', view=view.name):
+                if self.refine != 'loop':
+                    self.refine_planes(poly_view_transform, axis_index)
+                    continue
+
+                refined = [[] for _ in range(len(self.planes))]
+                for (i, plane) in enumerate(self.planes.plane_index.tolist()):
                     # 3D coplanar intersection between polygons
                     intersection_3d = geo3d.intersect_3dpolygons(
-                        polygon3d, poly_view_transform, plane_axis)
+                        self.planes.polygon(i), poly_view_transform, plane_axis)
 
-                    if intersection_3d: # if not empty, add
-                        refined_polygons.append(intersection_3d)
-                self.planes[key] = (plane_point, plane_normal, refined_polygons)
+                    if intersection_3d: # if not empty, add (as an open ring)
+                        refined[plane].append(intersection_3d[:-1])
+                profiler.count(polygons_intersected=self.planes.n_polygons,
+                    polygons_kept=sum(len(r) for r in refined))
+                self.planes = PlaneStore.from_polygons(self.planes.keys,
+                    self.planes.points, self.planes.normals, refined)
         return self
 
 
+    def merge_planes(self) -> None:
+        """ Unions the touching polygons of every plane, before refining """
+        before = (self.planes.n_polygons, self.planes.n_vertices)
+        axis = int(np.argmax(np.abs(self.planes.normals[0]))) if len(self.planes) else 2
+        self.planes = merge_polygons(self.planes, axis)
+        self.merge_counts = before + (self.planes.n_polygons, self.planes.n_vertices)
+        profiler.count(polygons_merged=before[0] - self.planes.n_polygons,
+            vertices_merged=before[1] - self.planes.n_vertices)
+
+
+    def refine_planes(self, view_polygon: Polygon, axis: int) -> None:
+        """ Intersects the polygons of every plane with a view polygon (in
+            plane coordinates) at once """
+        self.planes, counters = refine_polygons(self.planes, view_polygon, axis,
+            self.merge == 'union')
+        profiler.count(**counters)
+
+
+    def refine_parallel(self, view_polygons: list[Polygon], axis: int) -> None:
+        """ Refines chunks of whole planes by every view in a process pool.
+            Workers get the view polygons once, chunks travel as arrays and
+            are merged in their order, so the result is the serial one """
+        from concurrent.futures import ProcessPoolExecutor
+        chunks = self.planes.chunks(4 * self.jobs)
+        parts = [self.planes.slice(first, last) for (first, last) in chunks]
+        tasks = [(p.vertices, p.offsets, p.plane_index, p.rings) for p in parts]
+
+        with ProcessPoolExecutor(max_workers=min(self.jobs, len(tasks)),
+            initializer=init_refine_worker,
+            initargs=(shapely.to_wkb(view_polygons).tolist(), axis,
+                self.merge == 'union')) as executor:
+            results = list(executor.map(refine_chunk, tasks))
+
+        self.planes = self.planes.merge([self.planes.with_polygons(*arrays)
+            for (arrays, _) in results])
+        for (_, counters) in results: profiler.count(**counters)
+
+
     def draw_model(self):
-        for (_, _, polygons) in self.planes.values():
-            for poly in polygons:
-                for i in range(len(poly)):
-                    a = poly[i]
-                    b = poly[(i + 1) % len(poly)]
-                    va = rl.Vector3(a[0], a[2], a[1])
-                    vb = rl.Vector3(b[0], b[2], b[1])
-                    rl.draw_line_3d(va, vb, rl.WHITE)
+        import pyray as rl
+        starts, ends = self.planes.edges()
+        for (a, b) in zip(starts.tolist(), ends.tolist()):
+            va = rl.Vector3(a[0], a[2], a[1])
+            vb = rl.Vector3(b[0], b[2], b[1])
+            rl.draw_line_3d(va, vb, rl.WHITE)
 
 
-    def additional_info(self):
-        planes = len(self.planes)
-        polygons = 0
-        vertices = 0
+    def export_model(self, path: Path) -> None:
+        """ Writes the polygons of every plane to a compressed .npz file.
+            Ring i has the vertices offsets[i]:offsets[i+1], polygon j has
+            the rings rings[j]:rings[j+1] (exterior first) and lies on the
+            plane plane_index[j] """
+        np.savez_compressed(path,
+            bounds=np.array(self.bounds),
+            step=self.step,
+            plane_keys=self.planes.keys,
+            plane_points=self.planes.points,
+            plane_normals=self.planes.normals,
+            plane_index=self.planes.plane_index,
+            offsets=self.planes.offsets,
+            rings=self.planes.rings,
+            vertices=self.planes.vertices)
 
-        for _, (_, poly_list) in self.planes.items():
-            polygons += len(poly_list)
-            for polygon in poly_list:
-                vertices += len(polygon)
 
+    def additional_info(self):
         info = (f"[+] Model additional information:\n"
             f"Model bounds: {self.bounds}\n"
-            f"Number of planes: {planes}\n"
-            f"Number of polygons: {polygons}\n"
-            f"Number of vertices: {vertices}\n")
+            f"Number of planes: {len(self.planes)}\n"
+            f"Number of polygons: {self.planes.n_polygons}\n"
+            f"Number of holes: {self.planes.n_rings - self.planes.n_polygons}\n"
+            f"Number of vertices: {self.planes.n_vertices}\n"
+            f"Planes storage: {self.planes.nbytes / 2**20:.2f} MiB\n")
+
+        if self.merge_counts is not None:
+            polygons, vertices, merged_polygons, merged_vertices = self.merge_counts
+            info += (f"Merged polygons: {polygons} -> {merged_polygons}\n"
+                f"Merged vertices: {vertices} -> {merged_vertices}\n")
+        if self.slicing_counts is not None:
+            candidates, kept = self.slicing_counts
+            info += f"Adaptive slicing lines: {kept} of {candidates}\n"
         print(info)
+
+
+def plane_geometries(planes: PlaneStore, inplane: list[int]) -> np.ndarray:
+    """ Shapely polygons, in plane coordinates, of the polygons of a store """
+    rings = shapely.linearrings(planes.vertices[:, inplane],
+        indices=np.repeat(np.arange(planes.n_rings), planes.sizes))
+    return shapely.polygons(rings,
+        indices=np.repeat(np.arange(planes.n_polygons), np.diff(planes.rings)))
+
+
+def lift_polygons(polygons: np.ndarray, fixed: np.ndarray, axis: int) -> tuple:
+    """ lift_rings of shapely polygons (in plane coordinates), at the fixed
+        axis coordinate of every polygon """
+    def lift(polygon: np.ndarray, points: np.ndarray) -> np.ndarray:
+        lifted = np.empty((len(points), 3))
+        lifted[:, [a for a in range(3) if a != axis]] = points
+        lifted[:, axis] = fixed[polygon]
+        return lifted
+    return lift_rings(polygons, lift)
+
+
+def combine_polygons(planes: PlaneStore, kept: np.ndarray, lifted: tuple,
+    keys: np.ndarray, plane_index: np.ndarray) -> PlaneStore:
+    """ Store of the polygons kept from planes and then the lifted ones
+        (vertices, offsets, rings), stably sorted by their keys. Their
+        rings are gathered with one ragged index """
+    vertices, offsets, rings = lifted
+    ring_start = np.concatenate([planes.offsets[:-1], planes.n_vertices + offsets[:-1]])
+    ring_size = np.concatenate([planes.sizes, np.diff(offsets)])
+    first_ring = np.concatenate([planes.rings[kept], planes.n_rings + rings[:-1]])
+    ring_count = np.concatenate([np.diff(planes.rings)[kept], np.diff(rings)])
+    order = np.argsort(keys, kind='stable')
+    ring_ids = ragged_arange(first_ring[order], ring_count[order])
+    gather = ragged_arange(ring_start[ring_ids], ring_size[ring_ids])
+
+    return planes.with_polygons(
+        np.concatenate([planes.vertices, vertices])[gather],
+        np.concatenate([[0], np.cumsum(ring_size[ring_ids])]),
+        plane_index[order],
+        np.concatenate([[0], np.cumsum(ring_count[order])]))
+
+
+def merge_polygons(planes: PlaneStore, axis: int) -> PlaneStore:
+    """ Unions the polygons of every plane (GEOS unary union), so touching
+        polygons become one, with holes, and drops the collinear vertices """
+    if not planes.n_polygons:
+        return planes
+    # planes with a single polygon are kept as they are
+    bounds = np.searchsorted(planes.plane_index, np.arange(len(planes) + 1))
+    single = np.diff(bounds) == 1
+    kept = bounds[:-1][single]
+    merged = np.flatnonzero(np.diff(bounds) > 1)
+    geometries = plane_geometries(planes, [a for a in range(3) if a != axis])
+    unions = shapely.simplify(np.array([shapely.union_all(geometries[bounds[p]:bounds[p + 1]])
+        for p in merged.tolist()], dtype=object), 0)
+
+    parts, index = shapely.get_parts(unions, return_index=True)
+    polygonal = (shapely.get_type_id(parts) == shapely.GeometryType.POLYGON) & ~shapely.is_empty(parts)
+    parts, plane = parts[polygonal], merged[index[polygonal]]
+    fixed = planes.vertices[planes.offsets[planes.rings[bounds[plane]]], axis]
+    plane_index = np.concatenate([planes.plane_index[kept], plane])
+    return combine_polygons(planes, kept, lift_polygons(parts, fixed, axis),
+        plane_index, plane_index)
+
+
+def refine_polygons(planes: PlaneStore, view_polygon: Polygon, axis: int,
+    every_part: bool = False) -> tuple[PlaneStore, dict]:
+    """ Intersects the polygons of every plane with a view polygon (in
+        plane coordinates) at once. Polygons outside its bounds are dropped
+        and those inside it are kept, only the rest are clipped. A clipped
+        polygon is kept if it gives a single polygon, as its exterior (as
+        geo3d.intersect_3dpolygons), or as every polygon part of it with
+        their holes if every_part (merged planes). Returns the refined
+        store and the refinement counters """
+    if not planes.n_polygons:
+        return planes, {}
+
+    inplane = [a for a in range(3) if a != axis]
+    geometries = plane_geometries(planes, inplane)
+
+    # bounding boxes prefilter, the view polygon is prepared for the
+    # containment test of the polygons overlapping it
+    shapely.prepare(view_polygon)
+    min_u, min_v, max_u, max_v = view_polygon.bounds
+    bounds = shapely.bounds(geometries)
+    overlaps = (bounds[:, 0] <= max_u) & (bounds[:, 2] >= min_u) \
+        & (bounds[:, 1] <= max_v) & (bounds[:, 3] >= min_v)
+    inside = np.zeros(planes.n_polygons, dtype=bool)
+    inside[overlaps] = shapely.contains(view_polygon, geometries[overlaps])
+
+    clipped = np.flatnonzero(overlaps & ~inside)
+    intersections = shapely.intersection(geometries[clipped], view_polygon)
+    if every_part:
+        parts, index = shapely.get_parts(intersections, return_index=True)
+        polygonal = (shapely.get_type_id(parts) == shapely.GeometryType.POLYGON) & ~shapely.is_empty(parts)
+        parts, source = parts[polygonal], clipped[index[polygonal]]
+    else:
+        single = (shapely.get_type_id(intersections) == shapely.GeometryType.POLYGON) \
+            & ~shapely.is_empty(intersections)
+        parts, source = shapely.polygons(shapely.get_exterior_ring(intersections[single])), clipped[single]
+    fixed = planes.vertices[planes.offsets[planes.rings[source]], axis]
+
+    # kept polygons in their order: those inside as they are, then the
+    # parts of the clipped ones
+    kept = np.flatnonzero(inside)
+    sources = np.concatenate([kept, source])
+    refined = combine_polygons(planes, kept, lift_polygons(parts, fixed, axis),
+        sources, planes.plane_index[sources])
+    return refined, {'polygons_intersected': planes.n_polygons,
+        'polygons_clipped': len(clipped), 'polygons_kept': len(sources)}
+
+
+# view polygons, axis and every_part mode of a refinement worker process
+WORKER_VIEWS: tuple[list[Polygon], int, bool] | None = None
+
+
+def init_refine_worker(view_polygons: list[bytes], axis: int, every_part: bool) -> None:
+    global WORKER_VIEWS
+    polygons = list(shapely.from_wkb(view_polygons))
+    for polygon in polygons: shapely.prepare(polygon)
+    WORKER_VIEWS = (polygons, axis, every_part)
+
+
+def refine_chunk(arrays: tuple) -> tuple[tuple, dict]:
+    """ Refines a chunk of planes, (vertices, offsets, plane_index, rings),
+        by every view of the worker. Returns its arrays and counters """
+    polygons, axis, every_part = WORKER_VIEWS
+    planes = PlaneStore.empty().with_polygons(*arrays)
+    totals = {}
+    for polygon in polygons:
+        planes, counters = refine_polygons(planes, polygon, axis, every_part)
+        for (name, value) in counters.items():
+            totals[name] = totals.get(name, 0) + value
+    return (planes.vertices, planes.offsets, planes.plane_index, planes.rings), totals
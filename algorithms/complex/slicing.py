@@ -0,0 +1,69 @@
+import heapq
+import numpy as np
+
+
+def interval_table(rows: np.ndarray, start: np.ndarray, end: np.ndarray,
+    count: int) -> tuple[np.ndarray, np.ndarray]:
+    """ Number of intervals of each of count lines, and the (start, end)
+        values of their intervals as a (count, 2k) table padded with nan """
+    counts = np.bincount(rows, minlength=count)
+    order = np.argsort(rows, kind='stable')
+    rank = np.empty(len(rows), dtype=np.int64)
+    rank[order] = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    table = np.full((count, 2 * max(int(counts.max(initial=0)), 1)), np.nan)
+    table[rows, 2 * rank] = start
+    table[rows, 2 * rank + 1] = end
+    return counts, table
+
+
+def run_error(counts: np.ndarray, ends: np.ndarray, a: int, b: int,
+    tolerance: float, max_gap: int = 0) -> tuple[float, int]:
+    """ Largest error of the lines between a and b when their interval ends
+        are interpolated from those of a and b, and the line to split the
+        run at. Runs where the interval counts change, where the ends of
+        two neighbour lines differ by more than tolerance, or longer than
+        max_gap lines (0: no limit) have infinite error, and are split
+        where they change or at their middle """
+    changed = np.flatnonzero(np.any(counts[a + 1:b + 1] != counts[a], axis=1))
+    jumps = np.flatnonzero(np.nan_to_num(np.abs(np.diff(ends[a:b + 1], axis=0))).max(axis=1) > tolerance)
+    if len(changed) or len(jumps):
+        line = a + 1 + int(min(changed.min(initial=b - a), jumps.min(initial=b - a)))
+        return np.inf, line if line < b else b - 1
+    if max_gap and b - a > max_gap:
+        return np.inf, (a + b) // 2
+
+    t = (np.arange(a + 1, b) - a) / (b - a)
+    interpolated = ends[a] + (ends[b] - ends[a]) * t[:, np.newaxis]
+    deviation = np.nan_to_num(np.abs(ends[a + 1:b] - interpolated)).max(axis=1)
+    worst = int(np.argmax(deviation))
+    return float(deviation[worst]), a + 1 + worst
+
+
+def select_lines(counts: np.ndarray, ends: np.ndarray, tolerance: float,
+    max_lines: int = 0, max_gap: int = 0) -> np.ndarray:
+    """ Adaptive subset of n lines, from the number of intervals of every
+        view at every line, (n, views), and their ends, (n, m) padded with
+        nan. Starting from the first and last lines, the run with the
+        largest error (see run_error) is split until every run is within
+        tolerance or max_lines are kept (0: no limit). Returns the sorted
+        kept lines """
+    n = len(counts)
+    if n <= 2:
+        return np.arange(n)
+
+    kept = {0, n - 1}
+    runs = []
+    def push(a: int, b: int):
+        if b - a < 2: return
+        error, split = run_error(counts, ends, a, b, tolerance, max_gap)
+        heapq.heappush(runs, (-error, a, b, split))
+
+    push(0, n - 1)
+    while runs and (not max_lines or len(kept) < max_lines):
+        error, a, b, split = heapq.heappop(runs)
+        if -error <= tolerance: break
+        kept.add(split)
+        push(a, split)
+        push(split, b)
+    return np.array(sorted(kept))
@@ -1,13 +1,14 @@
 import numpy as np
-from shapely.geometry import LineString, MultiLineString
 from core.base_view import BaseView
 from utils.geo3d import Axis
 
 
 class View(BaseView):
     
-    def rasterization_segments(self, line_point, line_dir, step: float, bounds) -> list[tuple]:
-        """ Intersect a polygon with lines and collect the resulting segemnts """
+    def scanlines(self, line_point, line_dir, step: float, bounds) -> tuple[bool, np.ndarray] | None:
+        """ Lines of the view crossed by the planes: whether they are
+            horizontal (parallel to vx) and their (z or x) coordinates, every
+            step over the bounds. None if they are neither """
         # project the common line onto the view to get segment direction
         pq = self.origin - line_point
         t = np.dot(pq, line_dir) / np.dot(line_dir, line_dir)
@@ -17,41 +18,124 @@ class View(BaseView):
         # is the segment direction parallel to vx or vz?
         cross_with_vx = np.cross(direction, self.vx)
         cross_with_vz = np.cross(direction, self.vz)
-
         min_x, min_z, max_x, max_z = bounds
-        segments = []
 
         if np.linalg.norm(cross_with_vx) <= 1e-6:
             # segments are horizontal (parallel to vx -> sweep over z)
-            for z in np.arange(min_z, max_z + step, step):
-                line = LineString([(min_x - 1e6, z), (max_x + 1e6, z)])
-                intersection = self.polygon.intersection(line)
-                
-                if not intersection.is_empty:
-                    if isinstance(intersection, LineString):
-                        coords = list(intersection.coords)
-                        segments.append((coords[0], coords[-1]))
-                    elif isinstance(intersection, MultiLineString):
-                        for seg in intersection.geoms:
-                            coords = list(seg.coords)
-                            segments.append((coords[0], coords[-1]))
-
+            return True, np.arange(min_z, max_z + step, step)
         elif np.linalg.norm(cross_with_vz) <= 1e-6:
             # In this case the segments are vertical
-            for x in np.arange(min_x, max_x + step, step):
-                line = LineString([(x, min_z - 1e6), (x, max_z + 1e6)])
-                intersection = self.polygon.intersection(line)
-            
-                if not intersection.is_empty:
-                    if isinstance(intersection, LineString):
-                        coords = list(intersection.coords)
-                        segments.append((coords[0], coords[-1]))
-                    elif isinstance(intersection, MultiLineString):
-                        for seg in intersection.geoms:
-                            coords = list(seg.coords)
-                            segments.append((coords[0], coords[-1]))
-        return segments
-    
+            return False, np.arange(min_x, max_x + step, step)
+        return None
+
+
+    def line_intervals(self, horizontal: bool, lines: np.ndarray) -> tuple:
+        """ scanline_intervals of the view polygon with its horizontal (or
+            vertical) lines """
+        rings = [np.asarray(self.polygon.exterior.coords, dtype=float)]
+        rings += [np.asarray(ring.coords, dtype=float) for ring in self.polygon.interiors]
+        if not horizontal:
+            rings = [r[:, ::-1] for r in rings]
+        return self.scanline_intervals(rings, lines)
+
+
+    def rasterization_segments(self, line_point, line_dir, step: float, bounds,
+        lines: np.ndarray | None = None) -> list[tuple]:
+        """ Intersect a polygon with lines and collect the resulting segemnts.
+            Segments go in the direction of the axis, split where GEOS
+            splits the intersection of the polygon with every line (see
+            scanline_intervals). The lines can be given, instead of every
+            step over the bounds """
+        sweep = self.scanlines(line_point, line_dir, step, bounds)
+        if sweep is None:
+            return []
+        horizontal, every_step = sweep
+        lines = every_step if lines is None else np.asarray(lines, dtype=float)
+        rows, start, end = self.line_intervals(horizontal, lines)
+        line = lines[rows].tolist()
+
+        if horizontal:
+            return list(zip(zip(start.tolist(), line), zip(end.tolist(), line)))
+        return list(zip(zip(line, start.tolist()), zip(line, end.tolist())))
+
+
+    @staticmethod
+    def scanline_intervals(rings: list[np.ndarray], lines: np.ndarray) -> tuple:
+        """ Intersects the polygon given by its closed rings (n, 2) with the
+            horizontal lines v = lines[i]. Returns, sorted by line and u,
+            the line index, start and end u of every interval of the lines
+            inside the polygon or on its boundary (isolated points are not
+            intervals), split at the polygon vertices on the line, as the
+            intersection of GEOS. All the lines are processed at once from
+            the table of the polygon edges. """
+        edges = np.concatenate([np.stack([r[:-1], r[1:]], axis=1) for r in rings])
+        (u1, v1), (u2, v2) = edges[:, 0].T, edges[:, 1].T
+        order = np.argsort(lines, kind='stable')
+        sorted_lines = lines[order]
+
+        # non horizontal edges cross the lines with min(v) <= v < max(v)
+        slanted = v1 != v2
+        low, high = np.minimum(v1, v2)[slanted], np.maximum(v1, v2)[slanted]
+        first = np.searchsorted(sorted_lines, low, side='left')
+        last = np.searchsorted(sorted_lines, high, side='left')
+        count = last - first
+        edge = np.repeat(np.flatnonzero(slanted), count)
+        row = np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())
+        v = sorted_lines[row]
+        u = u1[edge] + (v - v1[edge]) * (u2[edge] - u1[edge]) / (v2[edge] - v1[edge])
+        # lines through a vertex cross its edges exactly at the vertex
+        u = np.where(v == v1[edge], u1[edge], np.where(v == v2[edge], u2[edge], u))
+
+        # pairs of consecutive crossings are the interior intervals
+        sort = np.lexsort((u, row))
+        row, u = row[sort], u[sort]
+        rows, starts, ends = [row[0::2]], [u[0::2]], [u[1::2]]
+
+        # horizontal edges lying on a line are boundary intervals
+        flat = np.flatnonzero(~slanted)
+        first = np.searchsorted(sorted_lines, v1[flat], side='left')
+        last = np.searchsorted(sorted_lines, v1[flat], side='right')
+        count = last - first
+        edge = np.repeat(flat, count)
+        rows.append(np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum()))
+        starts.append(np.minimum(u1[edge], u2[edge]))
+        ends.append(np.maximum(u1[edge], u2[edge]))
+
+        row, start, end = np.concatenate(rows), np.concatenate(starts), np.concatenate(ends)
+        if not len(row):
+            return row, start, end
+
+        # merge overlapping or touching intervals of each line: end values
+        # are ranked, so that a running maximum works across all the lines
+        sort = np.lexsort((start, row))
+        row, start, end = row[sort], start[sort], end[sort]
+        vertices = np.concatenate([r[:-1] for r in rings])
+        first = np.searchsorted(sorted_lines, vertices[:, 1], side='left')
+        last = np.searchsorted(sorted_lines, vertices[:, 1], side='right')
+        count = last - first
+        vertex_row = np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())
+        vertex_u = np.repeat(vertices[:, 0], count)
+        values, ranks = np.unique(np.concatenate([start, end, vertex_u]), return_inverse=True)
+        size = len(values) + 1
+        start_rank = ranks[:len(start)] + row * size
+        reach = np.maximum.accumulate(ranks[len(start):2 * len(start)] + row * size)
+        new = np.ones(len(row), dtype=bool)
+        new[1:] = start_rank[1:] > reach[:-1]
+        group = np.flatnonzero(new)
+        last = np.append(group[1:], len(row)) - 1
+        start_rank, end_rank = start_rank[group], reach[last]
+
+        # the merged intervals are split at the polygon vertices on their
+        # line, as GEOS nodes the line there: pieces between consecutive
+        # ends or vertices of a line, inside a merged interval
+        points = np.unique(np.concatenate([start_rank, end_rank,
+            ranks[2 * len(start):] + vertex_row * size]))
+        low, high = points[:-1], points[1:]
+        inside = np.searchsorted(start_rank, low, side='right') - 1
+        keep = (inside >= 0) & (high <= end_rank[np.maximum(inside, 0)])
+        low, high = low[keep], high[keep]
+        return order[low // size], values[low % size], values[high % size]
+
 
     def polygon_view_to_plane(self, axis: Axis) -> list[tuple]:
         """ converts a local view 2D coordinate polygon to a 2D coordinate 
@@ -0,0 +1,5 @@
+from algorithms import lazy_model
+ALGORITHM_NAME = 'polyhedral'
+ALGORITHM_PARAMS = {}
+
+__getattr__ = lazy_model(__name__)
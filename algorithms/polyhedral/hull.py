@@ -0,0 +1,141 @@
+import numpy as np
+import shapely
+from shapely import affinity
+from algorithms.polyhedral.view import View
+
+# the faces of two prisms can lie on the same plane. Their overlap is
+# computed on this grid, so that rounding does not decide whether it exists
+GRID_SIZE = 1e-9
+
+
+class PrismFaces:
+
+    """ Side faces of the prisms extruded from the view polygons along
+        their vy. Face i is the strip origins[i] + s*edges[i] + t*directions[i]
+        with 0 <= s <= lengths[i], of the polygon edge of view views[i]
+        (edges and directions are unit vectors, normals point outwards) """
+    origins: np.ndarray
+    edges: np.ndarray
+    directions: np.ndarray
+    normals: np.ndarray
+    lengths: np.ndarray
+    views: np.ndarray
+
+    def __init__(self, origins: np.ndarray, edges: np.ndarray, directions: np.ndarray,
+        normals: np.ndarray, lengths: np.ndarray, views: np.ndarray):
+        self.origins = origins
+        self.edges = edges
+        self.directions = directions
+        self.normals = normals
+        self.lengths = lengths
+        self.views = views
+
+
+    @classmethod
+    def extrude(cls, views: list[View]) -> 'PrismFaces':
+        """ Faces of the prisms of all the views, in view and edge order """
+        parts = []
+        for (index, view) in enumerate(views):
+            start, end = view.edges()
+            delta = end - start
+            edges = delta[:, :1] * view.vx + delta[:, 1:] * view.vz
+            lengths = np.linalg.norm(edges, axis=1)
+            keep = lengths > 0
+            # the polygon is on the left of its edges: (dz, -dx) points outwards
+            normals = delta[:, 1:] * view.vx - delta[:, :1] * view.vz
+            parts.append((view.plane_to_real_batch(start)[keep],
+                edges[keep] / lengths[keep, np.newaxis],
+                np.tile(view.vy / np.linalg.norm(view.vy), (int(keep.sum()), 1)),
+                normals[keep] / np.linalg.norm(normals[keep], axis=1)[:, np.newaxis],
+                lengths[keep], np.full(int(keep.sum()), index)))
+        return cls(*(np.concatenate(arrays) for arrays in zip(*parts)))
+
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+
+    def lift(self, face: np.ndarray, points: np.ndarray) -> np.ndarray:
+        """ Real coordinates of (s, t) points, (n, 2), of the given faces """
+        return self.origins[face] + points[:, :1] * self.edges[face] \
+            + points[:, 1:] * self.directions[face]
+
+
+def extent(views: list[View]) -> np.ndarray:
+    """ Corners, (8, 3), of a box holding the intersection of the prisms:
+        the bounding box of the lifted view polygons, grown by its diagonal """
+    points = np.concatenate([view.plane_to_real_batch(
+        np.asarray(view.polygon.exterior.coords)) for view in views])
+    low, high = points.min(axis=0), points.max(axis=0)
+    margin = np.linalg.norm(high - low)
+    low, high = low - margin, high + margin
+    return np.array([[x, y, z] for x in (low[0], high[0])
+        for y in (low[1], high[1]) for z in (low[2], high[2])])
+
+
+def section(faces: PrismFaces, i: int, rect: shapely.Polygon, view: View,
+    closed: bool) -> shapely.Geometry:
+    """ Section of the prism of a view by the plane of face i, in (s, t)
+        face coordinates. If the plane is parallel to the view's vy, the
+        section is made of strips, one per interval of the view polygon
+        along the line the plane projects to. Where that line runs along
+        the polygon boundary, the faces coincide: only a closed section
+        keeps them """
+    b = view.transform_inv @ (faces.origins[i] - view.origin)
+    A = np.stack([view.transform_inv @ faces.edges[i],
+        view.transform_inv @ faces.directions[i]], axis=1)
+
+    if abs(np.linalg.det(A)) > 1e-9 * np.sum(A * A):
+        # the plane maps onto the view: the section is the polygon back
+        inverse = np.linalg.inv(A)
+        offset = -inverse @ b
+        return affinity.affine_transform(view.polygon, [inverse[0, 0], inverse[0, 1],
+            inverse[1, 0], inverse[1, 1], offset[0], offset[1]])
+
+    # the plane projects to the line b + g * k.(s, t) of the view
+    column = int(np.argmax(np.linalg.norm(A, axis=0)))
+    g = A[:, column] / np.linalg.norm(A[:, column])
+    k = g @ A
+    corners = np.asarray(rect.exterior.coords)
+    reach = corners @ k
+    line = shapely.LineString([b + g * reach.min(), b + g * reach.max()])
+    pieces = shapely.intersection(view.polygon, line, grid_size=GRID_SIZE)
+    if not closed:
+        pieces = shapely.difference(pieces, view.polygon.boundary, grid_size=GRID_SIZE)
+
+    # intervals of k.(s, t), touching ones joined
+    reaches = [(np.asarray(part.coords) - b) @ g for part in shapely.get_parts(pieces)
+        if isinstance(part, shapely.LineString) and part.length > 0]
+    intervals = sorted((r.min(), r.max()) for r in reaches)
+    joined = []
+    for (low, high) in intervals:
+        if joined and low <= joined[-1][1]:
+            joined[-1][1] = max(joined[-1][1], high)
+        else:
+            joined.append([low, high])
+
+    # strips across the whole rectangle
+    k2 = float(k @ k)
+    across = np.array([-k[1], k[0]]) / np.sqrt(k2) * 2 * np.ptp(corners, axis=0).sum()
+    center = corners.mean(axis=0)
+    center = center - (center @ k) * k / k2
+    return shapely.MultiPolygon([shapely.Polygon([
+        center + low * k / k2 - across, center + high * k / k2 - across,
+        center + high * k / k2 + across, center + low * k / k2 + across])
+        for (low, high) in joined])
+
+
+def clip_face(faces: PrismFaces, i: int, views: list[View], box: np.ndarray) -> list[shapely.Polygon]:
+    """ Polygons, in (s, t) face coordinates, of the part of face i inside
+        every other prism. Faces shared by several prisms are kept by the
+        first of their views """
+    t = (box - faces.origins[i]) @ faces.directions[i]
+    rect = shapely.box(0, t.min(), faces.lengths[i], t.max())
+    owner = faces.views[i]
+    sections = [section(faces, i, rect, view, closed=index > owner)
+        for (index, view) in enumerate(views) if index != owner]
+    if any(shapely.is_empty(sections)):
+        return []
+    region = shapely.intersection_all([rect] + sections)
+    return [part for part in shapely.get_parts(region)
+        if isinstance(part, shapely.Polygon) and part.area > 0]
@@ -0,0 +1,163 @@
+import numpy as np
+import shapely
+from pathlib import Path
+from core.base_model import BaseModel
+from core import profiler
+from algorithms.polyhedral.view import View
+from algorithms.polyhedral.hull import PrismFaces, extent, clip_face
+from utils.planes import PlaneStore, lift_rings
+
+
+class Model(BaseModel):
+
+    """ Exact visual hull: the intersection of the prisms extruded from
+        every view polygon along its vy. faces are the prism side faces,
+        planes the polygons of the hull surface on every face (a plane per
+        face) and vertices, normals and indices its triangle mesh """
+    faces: PrismFaces | None
+    planes: PlaneStore
+    volume: float
+    vertices: np.ndarray
+    normals: np.ndarray
+    indices: np.ndarray
+    render_model: object # raylib model, uploaded on the first draw
+
+    def __init__(self, path: str, **kwargs):
+        self.faces = None
+        self.planes = PlaneStore.empty()
+        self.volume = 0.0
+        self.vertices = np.empty((0, 3), dtype=np.float32)
+        self.normals = np.empty((0, 3), dtype=np.float32)
+        self.indices = np.empty((0, 3), dtype=np.uint32)
+        self.render_model = None
+        super().__init__(path, View, **kwargs)
+
+
+    def initial_reconstruction(self):
+        """ Extrudes the view polygons. The hull is bounded if there are two
+            views with different directions """
+        directions = [view.vy / np.linalg.norm(view.vy) for view in self.views]
+        if not any(np.linalg.norm(np.cross(directions[0], d)) > 1e-6 for d in directions[1:]):
+            return self
+        self.faces = PrismFaces.extrude(self.views)
+        profiler.count(faces=len(self.faces))
+        return self
+
+
+    def refine_model(self):
+        """ Clips every face by the prisms of the other views """
+        if self.faces is None:
+            return self
+        faces, box = self.faces, extent(self.views)
+        polygons, plane_index = [], []
+        for (index, view) in enumerate(self.views):
+            with profiler.stage('clip_faces', view=view.name):
+                selected = np.flatnonzero(faces.views == index)
+                for i in selected:
+                    clipped = clip_face(faces, i, self.views, box)
+                    polygons += clipped
+                    plane_index += [i] * len(clipped)
+                profiler.count(faces=len(selected), polygons=len(polygons))
+
+        self.planes = self.lift_polygons(np.array(polygons, dtype=object),
+            np.array(plane_index, dtype=np.int64))
+        # divergence theorem, the faces are flat
+        areas = np.bincount(self.planes.plane_index, minlength=len(faces),
+            weights=shapely.area(np.array(polygons, dtype=object)) if polygons else None)
+        self.volume = float(np.sum(areas * np.einsum('ij,ij->i', faces.normals, faces.origins)) / 3)
+        return self
+
+
+    def lift_polygons(self, polygons: np.ndarray, plane_index: np.ndarray) -> PlaneStore:
+        """ Store of the (s, t) polygons of the faces, with open rings """
+        faces = self.faces
+        store = PlaneStore(np.arange(len(faces), dtype=float), faces.origins,
+            faces.normals, np.empty((0, 3)), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64))
+        vertices, offsets, rings = lift_rings(polygons,
+            lambda polygon, points: faces.lift(plane_index[polygon], points))
+        return store.with_polygons(vertices, offsets, plane_index, rings)
+
+
+    def face_polygons(self) -> np.ndarray:
+        """ Shapely polygons of the store, in (s, t) face coordinates """
+        planes, faces = self.planes, self.faces
+        ring = np.repeat(np.arange(planes.n_polygons), np.diff(planes.rings))
+        face = np.repeat(planes.plane_index[ring], planes.sizes)
+        delta = planes.vertices - faces.origins[face]
+        points = np.stack([np.einsum('ij,ij->i', delta, faces.edges[face]),
+            np.einsum('ij,ij->i', delta, faces.directions[face])], axis=1)
+        rings = shapely.linearrings(points,
+            indices=np.repeat(np.arange(planes.n_rings), planes.sizes))
+        return shapely.polygons(rings, indices=ring)
+
+
+    def generate_surface(self):
+        """ Triangulates the hull polygons (constrained Delaunay), with the
+            triangles counter-clockwise seen from outside """
+        if not self.planes.n_polygons:
+            return self
+        faces = self.faces
+        polygons = self.face_polygons()
+        triangles, polygon = shapely.get_parts(
+            shapely.constrained_delaunay_triangles(polygons), return_index=True)
+        face = self.planes.plane_index[polygon]
+        corners = shapely.get_coordinates(triangles).reshape(-1, 4, 2)[:, :3]
+        vertices = faces.lift(np.repeat(face, 3), corners.reshape(-1, 2)).reshape(-1, 3, 3)
+
+        # (s, t, normal) is not always right handed
+        normal = np.cross(vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0])
+        flip = np.einsum('ij,ij->i', normal, faces.normals[face]) < 0
+        vertices[flip] = vertices[flip][:, ::-1]
+
+        self.vertices = vertices.reshape(-1, 3).astype(np.float32)
+        self.normals = np.repeat(faces.normals[face], 3, axis=0).astype(np.float32)
+        self.indices = np.arange(len(self.vertices), dtype=np.uint32).reshape(-1, 3)
+        self.render_model = None
+        profiler.count(triangles=len(self.indices))
+        return self
+
+
+    def draw_model(self) -> None:
+        import pyray as rl
+        from core.model_render import upload_mesh
+        if not len(self.indices):
+            return
+        if self.render_model is None:
+            self.render_model = upload_mesh(self.vertices, self.normals, self.indices)
+        rl.draw_model(self.render_model, rl.Vector3(0, 0, 0), 1.0, rl.WHITE)
+        start, end = self.planes.edges()
+        for (a, b) in zip(start.tolist(), end.tolist()):
+            va = rl.Vector3(a[0], a[2], a[1])
+            vb = rl.Vector3(b[0], b[2], b[1])
+            rl.draw_line_3d(va, vb, rl.BLACK)
+
+
+    def export_model(self, path: Path) -> None:
+        """ Writes the hull polygons of every face (flat vertex arrays, as
+            the complex planes) and the triangle mesh to a compressed .npz """
+        planes = self.planes
+        np.savez_compressed(path,
+            bounds=np.array(self.bounds),
+            volume=self.volume,
+            face_points=planes.points,
+            face_normals=planes.normals,
+            plane_index=planes.plane_index,
+            offsets=planes.offsets,
+            rings=planes.rings,
+            vertices=planes.vertices,
+            mesh_vertices=self.vertices,
+            mesh_normals=self.normals,
+            mesh_indices=self.indices)
+
+
+    def additional_info(self) -> None:
+        planes = self.planes
+        info = (f"[+] Model additional information:\n"
+            f"Model bounds: {self.bounds}\n"
+            f"Number of prism faces: {len(self.faces) if self.faces is not None else 0}\n"
+            f"Number of polygons: {planes.n_polygons}\n"
+            f"Number of holes: {planes.n_rings - planes.n_polygons}\n"
+            f"Number of vertices: {planes.n_vertices}\n"
+            f"Number of triangles: {len(self.indices)}\n"
+            f"Volume: {self.volume:.4f}")
+        print(info)
@@ -0,0 +1,14 @@
+import numpy as np
+import shapely
+from core.base_view import BaseView
+
+
+class View(BaseView):
+
+    def edges(self) -> tuple[np.ndarray, np.ndarray]:
+        """ Start and end points, (n, 2) each, of the edges of every ring of
+            the polygon. The exterior is counter-clockwise and the holes
+            clockwise, so the polygon is always on the left of its edges """
+        polygon = shapely.orient_polygons(self.polygon)
+        rings = [np.asarray(r.coords, dtype=float) for r in [polygon.exterior, *polygon.interiors]]
+        return np.concatenate([r[:-1] for r in rings]), np.concatenate([r[1:] for r in rings])
@@ -1,5 +1,4 @@
-from .model import Model
-
+from algorithms import lazy_model
 ALGORITHM_NAME = 'simple'
 ALGORITHM_PARAMS = {
     'resolution': {
@@ -7,5 +6,41 @@ ALGORITHM_PARAMS = {
         'required': False,
         'default': 16,
         'help': 'Voxel space resolution. Higher resolution leads to more accurate results.'
+    },
+    'storage': {
+        'type': str,
+        'required': False,
+        'default': 'dense',
+        'choices': ['dense', 'packed', 'octree', 'intervals', 'mapped', 'shared'],
+        'help': 'Voxel space storage: one byte per voxel (dense), 8 voxels per byte (packed), '
+            'a sparse octree carved coarse to fine (octree), the runs of active voxels '
+            'of every z column (intervals), 8 voxels per byte in a memory-mapped file, '
+            'processed by blocks of slabs (mapped) or 8 voxels per byte in shared memory, '
+            'carved by slabs in up to --jobs processes (shared).'
+    },
+    'mask': {
+        'type': str,
+        'required': False,
+        'default': 'raster',
+        'choices': ['raster', 'shapely'],
+        'help': 'How view masks are computed: rasterizing each polygon once (raster) '
+            'or testing every grid point against it (shapely).'
+    },
+    'voxels': {
+        'type': str,
+        'required': False,
+        'default': 'surface',
+        'choices': ['surface', 'all'],
+        'help': 'Voxels exported: only those with an empty neighbour (surface) '
+            'or every active voxel (all).'
+    },
+    'memory_budget': {
+        'type': float,
+        'required': False,
+        'default': 256,
+        'help': 'Memory (MiB) of the blocks of slabs of the mapped storage, which sets '
+            'how many slabs are carved and streamed at once.'
     }
-}
\ No newline at end of file
+}
+
+__getattr__ = lazy_model(__name__)
@@ -0,0 +1,269 @@
+from abc import abstractmethod
+import numpy as np
+import warnings
+from utils.geo3d import Plane
+
+# face visibility bits of a voxel, one per 6-neighbour direction
+FACE_X_NEG, FACE_X_POS = 1 << 0, 1 << 1
+FACE_Y_NEG, FACE_Y_POS = 1 << 2, 1 << 3
+FACE_Z_NEG, FACE_Z_POS = 1 << 4, 1 << 5
+
+
+class VoxelGrid:
+
+    """ Voxel space of resolution^3 cells, indexed as [x, y, z]. Passes
+        that stream the grid go through blocks of slab_size x slabs """
+    resolution: int
+    slab_size: int
+
+    def __init__(self, resolution: int):
+        self.resolution = resolution
+        self.slab_size = resolution
+
+
+    @abstractmethod
+    def carve(self, mask: np.ndarray, plane: Plane) -> None:
+        """ Must remove the voxels whose projection onto plane lies outside
+            mask. The mask is indexed as the plane's axes, e.g [x, z] """
+        warnings.warn('This method has to be implemented')
+
+
+    @abstractmethod
+    def carve_columns(self, start: int, mask: np.ndarray) -> None:
+        """ Must remove the voxels outside mask, a (n, resolution) block of
+            the z columns start, ..., start + n - 1 (in [x, y] order) """
+        warnings.warn('This method has to be implemented')
+
+
+    @abstractmethod
+    def count(self) -> int:
+        """ Must return the number of active voxels """
+        warnings.warn('This method has to be implemented')
+
+
+    @abstractmethod
+    def indices(self) -> np.ndarray:
+        """ Must return the (n, 3) indices of the active voxels """
+        warnings.warn('This method has to be implemented')
+
+
+    @abstractmethod
+    def slab(self, x: int) -> np.ndarray:
+        """ Must return the active voxels with index x as a dense
+            (resolution, resolution) boolean array, indexed as [y, z] """
+        warnings.warn('This method has to be implemented')
+
+
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        """ Must return the memory used by the voxel space """
+        warnings.warn('This method has to be implemented')
+
+
+    def surface(self) -> tuple[np.ndarray, np.ndarray]:
+        """ Indices of the active voxels with at least one empty 6-neighbour
+            (voxels out of the grid are empty) and their visible faces, as
+            FACE_* bits. The grid is scanned one x slab at a time. """
+        parts = list(self.slab_surfaces(0, self.resolution))
+        if not parts:
+            return np.empty((0, 3), dtype=np.int64), np.empty(0, dtype=np.uint8)
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+    def surface_blocks(self, size: int):
+        """ Yields the surface of every block of size x slabs, in order,
+            so that only one block is held at a time. A single block is
+            the whole surface() """
+        if size >= self.resolution:
+            yield self.surface()
+            return
+        for first in range(0, self.resolution, size):
+            parts = list(self.slab_surfaces(first, min(first + size, self.resolution)))
+            yield np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+    def index_blocks(self, size: int):
+        """ Yields the indices of the active voxels of every block of size
+            x slabs, in order. A single block is the whole indices() """
+        if size >= self.resolution:
+            yield self.indices()
+            return
+        for first in range(0, self.resolution, size):
+            last = min(first + size, self.resolution)
+            indices = np.argwhere(np.stack([self.slab(x) for x in range(first, last)]))
+            indices[:, 0] += first
+            yield indices
+
+
+    def slab_surfaces(self, first: int, last: int):
+        """ Yields the surface voxels and faces of the slabs first, ...,
+            last - 1, reading their neighbour slabs """
+        res = self.resolution
+        empty = np.zeros((res, res), dtype=bool)
+        previous = self.slab(first - 1) if first > 0 else empty
+        current = self.slab(first) if first < res else empty
+
+        for x in range(first, last):
+            following = self.slab(x + 1) if x + 1 < res else empty
+            visible = np.zeros((res, res), dtype=np.uint8)
+            visible[~previous] |= FACE_X_NEG
+            visible[~following] |= FACE_X_POS
+            visible[0, :] |= FACE_Y_NEG
+            visible[1:, :][~current[:-1, :]] |= FACE_Y_NEG
+            visible[-1, :] |= FACE_Y_POS
+            visible[:-1, :][~current[1:, :]] |= FACE_Y_POS
+            visible[:, 0] |= FACE_Z_NEG
+            visible[:, 1:][~current[:, :-1]] |= FACE_Z_NEG
+            visible[:, -1] |= FACE_Z_POS
+            visible[:, :-1][~current[:, 1:]] |= FACE_Z_POS
+            visible[~current] = 0
+
+            y, z = np.nonzero(visible)
+            yield np.stack([np.full(len(y), x), y, z], axis=1), visible[y, z]
+            previous, current = current, following
+
+
+class DenseGrid(VoxelGrid):
+
+    """ One byte (np.bool_) per voxel """
+    data: np.ndarray
+
+    def __init__(self, resolution: int):
+        super().__init__(resolution)
+        self.data = np.ones((resolution,)*3, dtype=bool)
+
+
+    def carve(self, mask: np.ndarray, plane: Plane) -> None:
+        if plane == Plane.XY:
+            self.data &= mask[:, :, np.newaxis]
+        elif plane == Plane.XZ:
+            self.data &= mask[:, np.newaxis, :]
+        else: # plane == Plane.YZ
+            self.data &= mask[np.newaxis, :, :]
+
+
+    def carve_columns(self, start: int, mask: np.ndarray) -> None:
+        columns = self.data.reshape(-1, self.resolution)
+        columns[start:start + len(mask)] &= mask
+
+
+    def count(self) -> int:
+        return int(np.count_nonzero(self.data))
+
+
+    def indices(self) -> np.ndarray:
+        return np.argwhere(self.data)
+
+
+    def slab(self, x: int) -> np.ndarray:
+        return self.data[x]
+
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+
+class PackedGrid(VoxelGrid):
+
+    """ Eight voxels per byte, packed along the z axis. The padding
+        bits of the last byte of each column are always zero. Passes go
+        through the blocks of slab_size x slabs, calling release on each
+        one once it is processed. """
+    data: np.ndarray
+
+    def __init__(self, resolution: int):
+        super().__init__(resolution)
+        self.data = self.allocate((resolution, resolution, (resolution + 7) // 8))
+        column = np.packbits(np.ones(resolution, dtype=bool))
+        for (first, last) in self.blocks():
+            self.data[first:last] = column
+            self.release(first, last)
+
+
+    def allocate(self, shape: tuple) -> np.ndarray:
+        """ Uninitialized uint8 array of the packed voxels """
+        return np.empty(shape, dtype=np.uint8)
+
+
+    def blocks(self) -> list[tuple[int, int]]:
+        """ (first, last) x slabs of every block of slab_size """
+        return [(first, min(first + self.slab_size, self.resolution))
+            for first in range(0, self.resolution, self.slab_size)]
+
+
+    def release(self, first: int, last: int) -> None:
+        """ Called once the slabs first, ..., last - 1 are processed """
+        pass
+
+
+    @staticmethod
+    def pack(mask: np.ndarray, plane: Plane) -> np.ndarray:
+        """ View mask as the bytes anded with the grid: 0xff or 0x00 for a
+            whole column (XY), packed bits along z otherwise """
+        if plane == Plane.XY:
+            return mask.view(np.uint8) * np.uint8(0xff)
+        return np.packbits(mask, axis=1)
+
+
+    def carve(self, mask: np.ndarray, plane: Plane) -> None:
+        masks = [(plane, self.pack(mask, plane))]
+        for (first, last) in self.blocks():
+            carve_block(self.data[first:last], first, masks)
+            self.release(first, last)
+
+
+    def carve_columns(self, start: int, mask: np.ndarray) -> None:
+        columns = self.data.reshape(-1, self.data.shape[2])
+        columns[start:start + len(mask)] &= np.packbits(mask, axis=1)
+        res = self.resolution
+        self.release(start // res, -(-(start + len(mask)) // res))
+
+
+    def count(self) -> int:
+        total = 0
+        for (first, last) in self.blocks():
+            total += int(np.bitwise_count(self.data[first:last]).sum())
+            self.release(first, last)
+        return total
+
+
+    def indices(self) -> np.ndarray:
+        parts = list(self.index_blocks(self.slab_size))
+        return np.concatenate(parts) if parts else np.empty((0, 3), dtype=np.int64)
+
+
+    def index_blocks(self, size: int):
+        # only the non-empty bytes are unpacked, in np.argwhere order
+        for first in range(0, self.resolution, size):
+            last = min(first + size, self.resolution)
+            x, y, b = np.nonzero(self.data[first:last])
+            bits = np.unpackbits(self.data[first:last][x, y, b][:, np.newaxis], axis=1)
+            row, bit = np.nonzero(bits)
+            self.release(first, last)
+            yield np.stack([first + x[row], y[row], b[row] * 8 + bit], axis=1)
+
+
+    def slab(self, x: int) -> np.ndarray:
+        slab = np.unpackbits(self.data[x], axis=1, count=self.resolution).view(bool)
+        self.release(x, x + 1)
+        return slab
+
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+
+def carve_block(block: np.ndarray, first: int, masks: list[tuple[Plane, np.ndarray]]) -> None:
+    """ Applies every packed mask (see PackedGrid.pack) to the x slabs
+        first, ..., first + len(block) - 1 of a packed grid """
+    last = first + len(block)
+    for (plane, mask) in masks:
+        if plane == Plane.XY:
+            block &= mask[first:last, :, np.newaxis]
+        elif plane == Plane.XZ:
+            block &= mask[first:last, np.newaxis, :]
+        else: # plane == Plane.YZ
+            block &= mask[np.newaxis, :, :]
@@ -0,0 +1,170 @@
+import numpy as np
+from utils.geo3d import Plane
+from algorithms.simple.grid import (VoxelGrid, FACE_X_NEG, FACE_X_POS,
+    FACE_Y_NEG, FACE_Y_POS, FACE_Z_NEG, FACE_Z_POS)
+from utils.arrays import ragged_arange
+
+# z columns combined at once, bounds the temporary arrays of every operation
+CHUNK_COLUMNS = 1 << 18
+
+
+def mask_runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Row, start and end (exclusive) of the runs of True of every row of
+        a 2D boolean mask, sorted by row and start """
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    change = np.diff(padded, axis=1)
+    row, start = np.nonzero(change == 1)
+    _, end = np.nonzero(change == -1)
+    return row, start, end
+
+
+def combine(a: tuple, b: tuple, keep, length: int) -> tuple:
+    """ Maximal intervals, as (group, start, end) arrays, where keep(in a,
+        in b) holds. a and b are disjoint intervals sorted by group and
+        start, positions are below length. Both are swept at once: their
+        ends are sorted and the coverage of each one is a running sum """
+    (ga, sa, ea), (gb, sb, eb) = a, b
+    group = np.concatenate([ga, ga, gb, gb]).astype(np.int64)
+    position = np.concatenate([sa, ea, sb, eb]).astype(np.int64)
+    na, nb = len(ga), len(gb)
+    step_a = np.concatenate([np.ones(na, np.int8), -np.ones(na, np.int8), np.zeros(2 * nb, np.int8)])
+    step_b = np.concatenate([np.zeros(2 * na, np.int8), np.ones(nb, np.int8), -np.ones(nb, np.int8)])
+
+    order = np.argsort(group * (length + 1) + position, kind='stable')
+    group, position = group[order], position[order]
+    inside = keep(np.cumsum(step_a[order]) > 0, np.cumsum(step_b[order]) > 0)
+
+    # the state after an event holds until the next one, in the same group
+    valid = inside[:-1] & (group[1:] == group[:-1]) & (position[1:] > position[:-1])
+    group, start, end = group[:-1][valid], position[:-1][valid], position[1:][valid]
+    joined = np.ones(len(group), dtype=bool)
+    joined[1:] = (group[1:] != group[:-1]) | (start[1:] != end[:-1])
+    first = np.flatnonzero(joined)
+    last = np.append(first[1:], len(group))[:len(first)] - 1
+    return group[first], start[first], end[last]
+
+
+class IntervalGrid(VoxelGrid):
+
+    """ Runs of active voxels of every z column (x * resolution + y), as
+        flat arrays sorted by column and start. Each run is the voxels
+        start, ..., end - 1 of its column, so memory depends on the number
+        of runs instead of the number of voxels """
+    column: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+
+    def __init__(self, resolution: int):
+        super().__init__(resolution)
+        self.column = np.arange(resolution * resolution, dtype=np.int64)
+        self.start = np.zeros(resolution * resolution, dtype=np.int32)
+        self.end = np.full(resolution * resolution, resolution, dtype=np.int32)
+
+
+    def carve(self, mask: np.ndarray, plane: Plane) -> None:
+        res = self.resolution
+        if plane == Plane.XY:
+            # whole columns are kept or removed
+            keep = mask.reshape(-1)[self.column]
+            self.column, self.start, self.end = self.column[keep], self.start[keep], self.end[keep]
+        elif plane == Plane.XZ:
+            self.clip(0, res * res, lambda column: column // res, mask)
+        else: # plane == Plane.YZ
+            self.clip(0, res * res, lambda column: column % res, mask)
+
+
+    def carve_columns(self, start: int, mask: np.ndarray) -> None:
+        self.clip(start, start + len(mask), lambda column: column - start, mask)
+
+
+    def clip(self, first: int, last: int, row, mask: np.ndarray) -> None:
+        """ Intersects the columns first, ..., last - 1 with the runs of
+            the mask row row(column) of each one """
+        runs_row, runs_start, runs_end = mask_runs(mask)
+        row_first = np.searchsorted(runs_row, np.arange(len(mask)))
+        row_count = np.bincount(runs_row, minlength=len(mask))
+        low, high = np.searchsorted(self.column, [first, last])
+        parts = [(self.column[:low], self.start[:low], self.end[:low])]
+
+        for chunk in range(first, last, CHUNK_COLUMNS):
+            a, b = np.searchsorted(self.column, [chunk, min(chunk + CHUNK_COLUMNS, last)])
+            columns = np.unique(self.column[a:b])
+            rows = row(columns)
+            runs = ragged_arange(row_first[rows], row_count[rows])
+            group, start, end = combine((self.column[a:b], self.start[a:b], self.end[a:b]),
+                (np.repeat(columns, row_count[rows]), runs_start[runs], runs_end[runs]),
+                np.logical_and, self.resolution)
+            parts.append((group, start, end))
+
+        parts.append((self.column[high:], self.start[high:], self.end[high:]))
+        self.column = np.concatenate([p[0] for p in parts]).astype(np.int64)
+        self.start = np.concatenate([p[1] for p in parts]).astype(np.int32)
+        self.end = np.concatenate([p[2] for p in parts]).astype(np.int32)
+
+
+    def count(self) -> int:
+        return int(np.sum(self.end - self.start, dtype=np.int64))
+
+
+    def indices(self) -> np.ndarray:
+        lengths = self.end - self.start
+        column = np.repeat(self.column, lengths)
+        z = ragged_arange(self.start, lengths)
+        return np.stack([column // self.resolution, column % self.resolution, z], axis=1)
+
+
+    def slab(self, x: int) -> np.ndarray:
+        res = self.resolution
+        a, b = np.searchsorted(self.column, [x * res, (x + 1) * res])
+        steps = np.zeros((res, res + 1), dtype=np.int8)
+        y = self.column[a:b] - x * res
+        np.add.at(steps, (y, self.start[a:b]), 1)
+        np.add.at(steps, (y, self.end[a:b]), -1)
+        return np.cumsum(steps, axis=1)[:, :res] > 0
+
+
+    @property
+    def nbytes(self) -> int:
+        return self.column.nbytes + self.start.nbytes + self.end.nbytes
+
+
+    def surface(self) -> tuple[np.ndarray, np.ndarray]:
+        """ Surface voxels straight from the runs: the ends of every run
+            have visible z faces, and the parts of a run not covered by
+            the x (or y) neighbour column have visible x (or y) faces """
+        res = self.resolution
+        # neighbour of column c for each face: its column and whether it exists
+        neighbours = [
+            (FACE_X_NEG, -res, lambda c: c >= res),
+            (FACE_X_POS, res, lambda c: c < res * (res - 1)),
+            (FACE_Y_NEG, -1, lambda c: c % res != 0),
+            (FACE_Y_POS, 1, lambda c: c % res != res - 1),
+        ]
+        keys, bits = [np.empty(0, np.int64)], [np.empty(0, np.uint8)]
+        for chunk in range(0, res * res, CHUNK_COLUMNS):
+            a, b = np.searchsorted(self.column, [chunk, chunk + CHUNK_COLUMNS])
+            own = (self.column[a:b], self.start[a:b], self.end[a:b])
+            keys += [own[0] * res + own[1], own[0] * res + own[2] - 1]
+            bits += [np.full(b - a, FACE_Z_NEG, np.uint8), np.full(b - a, FACE_Z_POS, np.uint8)]
+
+            for (bit, offset, exists) in neighbours:
+                c, d = np.searchsorted(self.column, [chunk + offset, chunk + CHUNK_COLUMNS + offset])
+                column = self.column[c:d] - offset
+                present = exists(column)
+                group, start, end = combine(own, (column[present],
+                    self.start[c:d][present], self.end[c:d][present]),
+                    lambda inside, covered: inside & ~covered, res)
+                lengths = end - start
+                keys.append(np.repeat(group * res, lengths) + ragged_arange(start, lengths))
+                bits.append(np.full(int(lengths.sum()), bit, np.uint8))
+
+        keys, bits = np.concatenate(keys), np.concatenate(bits)
+        if not len(keys):
+            return np.empty((0, 3), dtype=np.int64), np.empty(0, dtype=np.uint8)
+        order = np.argsort(keys, kind='stable')
+        keys, bits = keys[order], bits[order]
+        first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        faces = np.bitwise_or.reduceat(bits, first)
+        keys = keys[first]
+        return np.stack([keys // (res * res), keys // res % res, keys % res], axis=1), faces
@@ -0,0 +1,57 @@
+import mmap
+import tempfile
+import weakref
+import numpy as np
+from algorithms.simple.grid import PackedGrid
+
+
+class MappedGrid(PackedGrid):
+
+    """ PackedGrid kept in a memory-mapped temporary file (in the TMPDIR
+        directory) that is deleted with the grid, or by close. Every pass
+        goes through blocks of slab_size x slabs, dropping each block from
+        memory once it is processed, so the working set is about a block,
+        whatever the resolution """
+    memory_budget: float
+    file: object
+    map: mmap.mmap
+
+    def __init__(self, resolution: int, memory_budget: float = 256):
+        self.memory_budget = memory_budget
+        super().__init__(resolution)
+
+
+    def allocate(self, shape: tuple) -> np.ndarray:
+        # a block of slabs fits in the budget (MiB)
+        slab_bytes = shape[1] * shape[2]
+        self.slab_size = int(min(shape[0], max(1, self.memory_budget * 2**20 // slab_bytes)))
+
+        self.file = tempfile.TemporaryFile(prefix='voxels-')
+        self.file.truncate(shape[0] * slab_bytes)
+        self.map = mmap.mmap(self.file.fileno(), shape[0] * slab_bytes)
+        weakref.finalize(self, self.file.close)
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.map)
+
+
+    def close(self) -> None:
+        """ Unmaps and deletes the file, the grid can not be used anymore """
+        # the map can not be closed while data views it
+        del self.data
+        self.map.close()
+        self.file.close()
+
+
+    def release(self, first: int, last: int) -> None:
+        """ Drops the pages of the slabs first, ..., last - 1 from memory,
+            their changes are kept in the file """
+        slab_bytes = self.data.shape[1] * self.data.shape[2]
+        start = first * slab_bytes // mmap.PAGESIZE * mmap.PAGESIZE
+        end = min(len(self.map), -(-last * slab_bytes // mmap.PAGESIZE) * mmap.PAGESIZE)
+        if end > start:
+            self.map.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+    @property
+    def nbytes(self) -> int:
+        """ Size of the mapped file, about a block of it is in memory """
+        return self.data.nbytes
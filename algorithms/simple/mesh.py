@@ -0,0 +1,114 @@
+import numpy as np
+
+
+class Mesh:
+
+    """ Triangle mesh of the voxels surface. Every quad has its own four
+        vertices (vertices and normals are (4q, 3) arrays) and two
+        counter-clockwise triangles seen from outside (indices, (2q, 3)). """
+    vertices: np.ndarray
+    normals: np.ndarray
+    indices: np.ndarray
+    faces: int
+
+    def __init__(self, vertices: np.ndarray, normals: np.ndarray,
+        indices: np.ndarray, faces: int):
+        self.vertices = vertices
+        self.normals = normals
+        self.indices = indices
+        self.faces = faces
+
+
+    @classmethod
+    def concatenate(cls, meshes: list['Mesh']) -> 'Mesh':
+        """ Single mesh with the quads of every mesh, in order """
+        starts = np.cumsum([0] + [len(m.vertices) for m in meshes[:-1]])
+        return cls(np.concatenate([m.vertices for m in meshes]),
+            np.concatenate([m.normals for m in meshes]),
+            np.concatenate([m.indices + np.uint32(s) for (m, s) in zip(meshes, starts)]),
+            sum(m.faces for m in meshes))
+
+
+    @property
+    def quads(self) -> int:
+        return len(self.indices) // 2
+
+
+def greedy_quads(indices: np.ndarray, faces: np.ndarray, bit: int) -> np.ndarray:
+    """ Merges the visible faces of a direction into rectangles. Faces are
+        joined into runs along the last in-plane axis (v), then equal runs
+        of consecutive rows (u) are joined. Returns (slice, u0, u1, v0, v1)
+        rows, with inclusive voxel ranges. """
+    axis = (bit.bit_length() - 1) // 2
+    u_axis, v_axis = [e for e in range(3) if e != axis]
+    selected = indices[(faces & bit) != 0].astype(np.int64)
+    if not len(selected):
+        return np.empty((0, 5), dtype=np.int64)
+    w, u, v = selected[:, axis], selected[:, u_axis], selected[:, v_axis]
+
+    # runs along v, inside the same row (w, u)
+    order = np.lexsort((v, u, w))
+    w, u, v = w[order], u[order], v[order]
+    start = np.ones(len(v), dtype=bool)
+    start[1:] = (w[1:] != w[:-1]) | (u[1:] != u[:-1]) | (v[1:] != v[:-1] + 1)
+    first = np.flatnonzero(start)
+    last = np.append(first[1:], len(v)) - 1
+    w, u, v0, v1 = w[first], u[first], v[first], v[last]
+
+    # equal runs of consecutive rows, inside the same slice w
+    order = np.lexsort((u, v1, v0, w))
+    w, u, v0, v1 = w[order], u[order], v0[order], v1[order]
+    start = np.ones(len(u), dtype=bool)
+    start[1:] = (w[1:] != w[:-1]) | (v0[1:] != v0[:-1]) \
+        | (v1[1:] != v1[:-1]) | (u[1:] != u[:-1] + 1)
+    first = np.flatnonzero(start)
+    last = np.append(first[1:], len(u)) - 1
+    return np.stack([w[first], u[first], u[last], v0[first], v1[first]], axis=1)
+
+
+def greedy_mesh(indices: np.ndarray, faces: np.ndarray,
+    bounds: tuple, resolution: int) -> Mesh:
+    """ Builds the mesh of the visible faces of the voxels with the given
+        indices. Voxel i of an axis spans a + i*(b-a)/res +- (b-a)/(2*res) """
+    vertices, normals, indices_list = [], [], []
+    count = 0
+    a, b = np.array(bounds[0::2], dtype=float), np.array(bounds[1::2], dtype=float)
+    size = (b - a) / resolution
+    low = lambda e, i: a[e] + i * size[e] - size[e] / 2
+    high = lambda e, i: a[e] + i * size[e] + size[e] / 2
+
+    for direction in range(6):
+        bit = 1 << direction
+        axis, positive = direction // 2, direction % 2
+        u_axis, v_axis = [e for e in range(3) if e != axis]
+        quads = greedy_quads(indices, faces, bit)
+        if not len(quads): continue
+
+        w = high(axis, quads[:, 0]) if positive else low(axis, quads[:, 0])
+        u0, u1 = low(u_axis, quads[:, 1]), high(u_axis, quads[:, 2])
+        v0, v1 = low(v_axis, quads[:, 3]), high(v_axis, quads[:, 4])
+
+        # corners counter-clockwise in the (u, v) plane
+        corners = np.empty((len(quads), 4, 3), dtype=np.float32)
+        corners[:, :, axis] = w[:, np.newaxis]
+        corners[:, :, u_axis] = np.stack([u0, u1, u1, u0], axis=1)
+        corners[:, :, v_axis] = np.stack([v0, v0, v1, v1], axis=1)
+
+        # (u, v, axis) is right handed except for the y axis
+        outward = 1 if positive else -1
+        clockwise = (outward if axis != 1 else -outward) < 0
+        local = np.array([[0, 2, 1], [0, 3, 2]] if clockwise else [[0, 1, 2], [0, 2, 3]])
+        triangles = count + np.arange(len(quads))[:, np.newaxis, np.newaxis] * 4 + local
+
+        normal = np.zeros(3, dtype=np.float32)
+        normal[axis] = outward
+        vertices.append(corners.reshape(-1, 3))
+        normals.append(np.broadcast_to(normal, (len(quads) * 4, 3)))
+        indices_list.append(triangles.reshape(-1, 3))
+        count += len(quads) * 4
+
+    if not vertices:
+        empty = np.empty((0, 3), dtype=np.float32)
+        return Mesh(empty, empty, np.empty((0, 3), dtype=np.uint32), 0)
+    return Mesh(np.concatenate(vertices), np.concatenate(normals).astype(np.float32),
+        np.concatenate(indices_list).astype(np.uint32), int(np.bitwise_count(faces).sum()))
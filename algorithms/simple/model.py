@@ -1,34 +1,105 @@
 import numpy as np
-import pyray as rl
+from pathlib import Path
 from core.base_model import BaseModel
+from core import profiler
 from algorithms.simple.view import View
-from utils.geo3d import Plane
+from algorithms.simple.grid import VoxelGrid, DenseGrid, PackedGrid
+from algorithms.simple.octree import OctreeGrid
+from algorithms.simple.intervals import IntervalGrid
+from algorithms.simple.mapped import MappedGrid
+from algorithms.simple.shared import SharedGrid
+from algorithms.simple.mesh import Mesh, greedy_mesh
+from utils.geo3d import Plane, PLANE_AXES
+
+# voxels projected at once by the general (oblique views) carving path
+CHUNK_VOXELS = 1 << 20
+
+GRIDS = {
+    'dense': DenseGrid,
+    'packed': PackedGrid,
+    'octree': OctreeGrid,
+    'intervals': IntervalGrid,
+    'mapped': MappedGrid,
+    'shared': SharedGrid,
+}
 
 
 class Model(BaseModel):
 
     resolution: int
-    voxel_space: np.ndarray[np.bool_]
-    cubes: list[tuple[float, float, float]]
+    storage: str
+    mask: str
+    voxels: str
+    memory_budget: float
+    voxel_space: VoxelGrid
+    surface_voxels: int
+    mesh: Mesh | None
+    render_model: object # raylib model, uploaded on the first draw
     cube_size: tuple[float, float, float]
 
-    def __init__(self, path: str, resolution: int):
+    def __init__(self, path: str, resolution: int, storage: str = 'dense',
+        mask: str = 'raster', voxels: str = 'surface', memory_budget: float = 256, **kwargs):
+        if storage not in GRIDS:
+            raise ValueError(f'Unknown voxel storage: {storage}')
+        if mask not in ('raster', 'shapely'):
+            raise ValueError(f'Unknown mask engine: {mask}')
+        if voxels not in ('surface', 'all'):
+            raise ValueError(f'Unknown voxels selection: {voxels}')
+        if memory_budget <= 0:
+            raise ValueError('The memory budget must be positive')
         self.resolution = resolution
-        self.cubes = []
-        super().__init__(path, View)
+        self.storage = storage
+        self.mask = mask
+        self.voxels = voxels
+        self.memory_budget = memory_budget
+        self.surface_voxels = 0
+        self.mesh = None
+        self.render_model = None
+        super().__init__(path, View, **kwargs)
 
 
     def initial_reconstruction(self):
         """ Initializes the voxel space """
-        self.voxel_space = np.ones((self.resolution,)*3, dtype=bool)
+        if self.storage == 'mapped':
+            self.voxel_space = MappedGrid(self.resolution, self.memory_budget)
+        elif self.storage == 'shared':
+            self.voxel_space = SharedGrid(self.resolution, self.jobs)
+        else:
+            self.voxel_space = GRIDS[self.storage](self.resolution)
         return self
 
 
     def refine_model(self):
         """ Reconstructs the model directly """
-        for view in self.views:
+        views = self.views
+        if isinstance(self.voxel_space, (OctreeGrid, SharedGrid)):
+            # all the axis-aligned views at once, the oblique ones go
+            # through the general path below
+            aligned = [view for view in views if view.is_axis_aligned()]
+            views = [view for view in views if not view.is_axis_aligned()]
+
+        if isinstance(self.voxel_space, OctreeGrid):
+            # coarse to fine
+            with profiler.stage('carve_views', views=len(aligned)):
+                self.voxel_space.carve_views(aligned, self.plane_samples)
+                profiler.count(leaves=sum(len(l) for l in self.voxel_space.leaves))
+
+        elif isinstance(self.voxel_space, SharedGrid):
+            # every slab carved by all the views
+            with profiler.stage('carve_views', views=len(aligned), jobs=self.voxel_space.jobs):
+                before = self.voxel_space.count() if profiler.enabled() else 0
+                self.voxel_space.carve_views([(self.view_mask(view), view.get_view_direction())
+                    for view in aligned])
+                if profiler.enabled():
+                    profiler.count(carved_voxels=before - self.voxel_space.count())
+
+        for view in views:
             # Merge each view voxel space with the model's
-            self.project_view_to_voxels(view)
+            with profiler.stage('carve_view', view=view.name):
+                before = self.voxel_space.count() if profiler.enabled() else 0
+                self.project_view_to_voxels(view)
+                if profiler.enabled():
+                    profiler.count(carved_voxels=before - self.voxel_space.count())
         return self
 
 
@@ -36,90 +107,177 @@ class Model(BaseModel):
         """ Project a 2D voxel grid onto a view, then remove those
             rows whose projection lies outside the view polygon.  """
 
+        if not view.is_axis_aligned():
+            # the view's extrusion is not parallel to the grid
+            self.project_view_to_voxels_general(view)
+            return
+        self.voxel_space.carve(self.view_mask(view), view.get_view_direction())
+
+
+    def view_mask(self, view: View) -> np.ndarray:
+        """ Mask of an axis-aligned view over the grid plane parallel to
+            it, True where the voxel centers project inside its polygon """
         res = self.resolution
-        get = lambda a, b, i: a + i * (b - a) / (res - 1)
         d = view.get_view_direction()
         indices = np.arange(res)
 
-        if d == Plane.XY:
-            # grid parallel to XY plane
-            i_grid, j_grid = np.meshgrid(indices, indices, indexing='ij')
-            wx = get(self.bounds[0], self.bounds[1], i_grid)
-            wy = get(self.bounds[2], self.bounds[3], j_grid)
-            wz = np.zeros_like(wx)
-        
-            # Vectorized conversion to 2D
-            points_3d = np.stack([wx, wy, wz], axis=-1)
-            points_2d = view.real_to_plane_batch(points_3d.reshape(-1, 3))
-            points_2d = points_2d.reshape(res, res, 2)
+        if self.mask == 'raster':
+            # only the first row and column of the grid are converted
+            zeros = np.zeros(res, dtype=int)
+            points_i = view.real_to_plane_batch(self.plane_samples(d, indices, zeros))
+            points_j = view.real_to_plane_batch(self.plane_samples(d, zeros, indices))
+            mask = view.points_inside_polygon_grid(points_i, points_j)
+            if mask is not None:
+                return mask
 
-            mask = view.points_inside_polygon_batch(points_2d)
-            self.voxel_space &= mask[:, :, np.newaxis]
+        # grid parallel to the view plane, vectorized conversion to 2D
+        i_grid, j_grid = np.meshgrid(indices, indices, indexing='ij')
+        points_3d = self.plane_samples(d, i_grid, j_grid)
+        points_2d = view.real_to_plane_batch(points_3d.reshape(-1, 3))
+        points_2d = points_2d.reshape(res, res, 2)
+        return view.points_inside_polygon_batch(points_2d)
 
-        elif d == Plane.XZ:
-            # grid parallel to XZ plane
-            i_grid, j_grid = np.meshgrid(indices, indices, indexing='ij')
-            wx = get(self.bounds[0], self.bounds[1], i_grid)
-            wz = get(self.bounds[4], self.bounds[5], j_grid)
-            wy = np.zeros_like(wx)
 
-            points_3d = np.stack([wx, wy, wz], axis=-1)
-            points_2d = view.real_to_plane_batch(points_3d.reshape(-1, 3))
-            points_2d = points_2d.reshape(res, res, 2)
-            
-            mask = view.points_inside_polygon_batch(points_2d)
-            self.voxel_space &= mask[:, np.newaxis, :]
-        
-        elif d == Plane.YZ:
-            # grid parallel to YZ plane
-            i_grid, j_grid = np.meshgrid(indices, indices, indexing='ij')
-            wy = get(self.bounds[2], self.bounds[3], i_grid)
-            wz = get(self.bounds[4], self.bounds[5], j_grid)
-            wx = np.zeros_like(wy)
-            
-            points_3d = np.stack([wx, wy, wz], axis=-1)
+    def project_view_to_voxels_general(self, view: View) -> None:
+        """ Projects every voxel center onto the view and removes those
+            outside the view polygon. The grid is processed in chunks of
+            z columns, so memory does not depend on the resolution """
+        res = self.resolution
+        get = lambda a, b, i: a + i * (b - a) / (res - 1)
+        columns = max(1, CHUNK_VOXELS // res)
+        wz = get(self.bounds[4], self.bounds[5], np.arange(res))
+
+        for start in range(0, res * res, columns):
+            stop = min(start + columns, res * res)
+            i, j = np.divmod(np.arange(start, stop), res)
+            points_3d = np.empty((stop - start, res, 3), dtype=float)
+            points_3d[..., 0] = get(self.bounds[0], self.bounds[1], i)[:, np.newaxis]
+            points_3d[..., 1] = get(self.bounds[2], self.bounds[3], j)[:, np.newaxis]
+            points_3d[..., 2] = wz
+
             points_2d = view.real_to_plane_batch(points_3d.reshape(-1, 3))
-            points_2d = points_2d.reshape(res, res, 2)
-            
+            points_2d = points_2d.reshape(stop - start, res, 2)
             mask = view.points_inside_polygon_batch(points_2d)
-            self.voxel_space &= mask[np.newaxis, :, :]
+            self.voxel_space.carve_columns(start, mask)
 
 
-    def generate_surface(self) -> None:
-        """ Gathers the real coordinates of the model voxels """
-        # calculate cube size
+    def plane_samples(self, plane: Plane, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+        """ Real coordinates of the voxel centers with indices (i, j) in a
+            grid parallel to plane. The coordinate along its normal is 0 """
+        res = self.resolution
+        get = lambda a, b, i: a + i * (b - a) / (res - 1)
+        a, b = PLANE_AXES[plane]
+
+        points = np.zeros(np.shape(i) + (3,), dtype=float)
+        points[..., a] = get(self.bounds[2 * a], self.bounds[2 * a + 1], i)
+        points[..., b] = get(self.bounds[2 * b], self.bounds[2 * b + 1], j)
+        return points
+
+
+    def generate_surface(self):
+        """ Builds the surface mesh: the visible faces of the voxels with
+            some empty 6-neighbour, merged into quads. The surface is
+            streamed by blocks of slabs (a single block unless the grid is
+            mapped), every block is meshed alone and only its quads are
+            kept, the voxels are streamed again by center_blocks """
         res = self.resolution
         size_x = (self.bounds[1] - self.bounds[0]) / self.resolution
         size_y = (self.bounds[3] - self.bounds[2]) / self.resolution
         size_z = (self.bounds[5] - self.bounds[4]) / self.resolution
         self.cube_size = (size_x, size_y, size_z)
-        
-        # get active voxels indices
-        active_idx = np.argwhere(self.voxel_space)
-        if not len(active_idx):
-            self.cubes = []
-            return
 
-        # vectorized coordinate calculation
-        fx = lambda a, b, i: a + i * (b - a) / res
-        cx = fx(self.bounds[0], self.bounds[1], active_idx[:, 0])
-        cy = fx(self.bounds[2], self.bounds[3], active_idx[:, 1])
-        cz = fx(self.bounds[4], self.bounds[5], active_idx[:, 2])
-        self.cubes = list(zip(cx, cy, cz))
+        grid = self.voxel_space
+        meshes, self.surface_voxels = [], 0
+        for (surface_idx, faces) in grid.surface_blocks(grid.slab_size):
+            meshes.append(greedy_mesh(surface_idx, faces, self.bounds, res))
+            self.surface_voxels += len(surface_idx)
+
+        # exposed faces merged into quads, uploaded once when drawn
+        self.mesh = Mesh.concatenate(meshes)
+        self.render_model = None
+        profiler.count(surface_voxels=self.surface_voxels, quads=self.mesh.quads)
         return self
 
 
+    def center_blocks(self):
+        """ Yields the real coordinates, as a (n, 3) float32 array, of the
+            voxels of every block of slab_size x slabs, and their visible
+            faces in surface mode (None otherwise). In surface mode, only
+            the voxels with some empty 6-neighbour are yielded """
+        res = self.resolution
+        grid = self.voxel_space
+        if self.voxels == 'surface':
+            blocks = grid.surface_blocks(grid.slab_size)
+        else:
+            blocks = ((indices, None) for indices in grid.index_blocks(grid.slab_size))
+        fx = lambda a, b, i: a + i * (b - a) / res
+
+        for (indices, faces) in blocks:
+            # vectorized coordinate calculation
+            centers = np.empty((len(indices), 3), dtype=np.float32)
+            centers[:, 0] = fx(self.bounds[0], self.bounds[1], indices[:, 0])
+            centers[:, 1] = fx(self.bounds[2], self.bounds[3], indices[:, 1])
+            centers[:, 2] = fx(self.bounds[4], self.bounds[5], indices[:, 2])
+            yield centers, faces
+
+
     def draw_model(self) -> None:
-        size = self.cube_size
-        for (cx, cy, cz) in self.cubes:
-            center = rl.Vector3(cx, cz, cy)
-            rl.draw_cube(center, size[0], size[1], size[2], rl.WHITE)
-            rl.draw_cube_wires(center, size[0], size[1], size[2], rl.BLACK)
+        import pyray as rl
+        from core.model_render import upload_mesh
+        if self.mesh is None or not len(self.mesh.indices):
+            return
+        if self.render_model is None:
+            self.render_model = upload_mesh(self.mesh.vertices,
+                self.mesh.normals, self.mesh.indices)
+        rl.draw_model(self.render_model, rl.Vector3(0, 0, 0), 1.0, rl.WHITE)
+
+
+    def export_model(self, path: Path) -> None:
+        """ Writes the voxel centers, their visible faces (in surface
+            mode) and the surface mesh to a compressed .npz file. The
+            voxels are written block by block (see center_blocks) """
+        import zipfile
+        empty = np.empty((0, 3), dtype=np.float32)
+        mesh = self.mesh
+        arrays = {
+            'bounds': np.array(self.bounds),
+            'resolution': np.array(self.resolution),
+            'vertices': mesh.vertices if mesh else empty,
+            'normals': mesh.normals if mesh else empty,
+            'indices': mesh.indices if mesh else np.empty((0, 3), dtype=np.uint32),
+        }
+        count = self.surface_voxels if self.voxels == 'surface' else self.voxel_space.count()
+        streamed = {'centers': ('<f4', (count, 3), 0)}
+        if self.voxels == 'surface':
+            streamed['faces'] = ('|u1', (count,), 1)
+        else:
+            arrays['faces'] = np.empty(0, dtype=np.uint8)
+
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for (name, array) in arrays.items():
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as file:
+                    np.lib.format.write_array(file, array)
+            # the header gives the final shape, the blocks follow it. An
+            # archive is written one member at a time, every streamed
+            # array is a pass over the blocks
+            for (name, (descr, shape, item)) in streamed.items():
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as file:
+                    np.lib.format.write_array_header_1_0(file,
+                        {'descr': descr, 'fortran_order': False, 'shape': shape})
+                    for block in self.center_blocks():
+                        file.write(block[item].tobytes())
 
 
     def additional_info(self) -> None:
+        active = self.voxel_space.count()
+        surface = self.surface_voxels
+        faces, quads = (self.mesh.faces, self.mesh.quads) if self.mesh else (0, 0)
         info = (f"[+] Model additional information:\n"
             f"Model bounds: {self.bounds}\n"
             f"Number of voxels: {self.resolution ** 3}\n"
-            f"Number of active voxels: {len(self.cubes)}")
+            f"Number of active voxels: {active}\n"
+            f"Number of surface voxels: {surface}\n"
+            f"Number of interior voxels: {active - surface}\n"
+            f"Surface mesh: {quads} quads ({faces} voxel faces)\n"
+            f"Voxel storage: {self.storage} ({self.voxel_space.nbytes} bytes)")
         print(info)
\ No newline at end of file
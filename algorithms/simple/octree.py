@@ -0,0 +1,221 @@
+from collections.abc import Callable
+import numpy as np
+import shapely
+from algorithms.simple.grid import VoxelGrid
+from algorithms.simple.view import View
+from utils.geo3d import Plane, PLANE_AXES
+
+# every child offset of a cell, in units of the child size
+CHILDREN = np.array([(x, y, z)
+    for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=np.int64)
+
+
+class OctreeGrid(VoxelGrid):
+
+    """ Sparse octree of the active voxels. Only full cells (leaves) are
+        stored: leaves[level] holds the origins of the active cells of
+        2^level voxels per side. Cells are clipped to the resolution. """
+    depth: int
+    leaves: list[np.ndarray]
+
+    def __init__(self, resolution: int):
+        super().__init__(resolution)
+        self.depth = max(0, int(np.ceil(np.log2(resolution))))
+        self.leaves = [np.empty((0, 3), dtype=np.uint16) for _ in range(self.depth + 1)]
+        # before carving, the root cell holds the whole voxel space
+        self.leaves[self.depth] = np.zeros((1, 3), dtype=np.uint16)
+
+
+    def carve(self, mask: np.ndarray, plane: Plane) -> None:
+        # voxels removed from a box: the empty mask cells of its footprint,
+        # times its extent along the plane's normal
+        a, b = PLANE_AXES[plane]
+        normal = 3 - a - b
+        table = self.summed_area(~mask)
+        self.clip(lambda low, high: (high[:, normal] - low[:, normal]) * (
+            table[high[:, a], high[:, b]] - table[low[:, a], high[:, b]]
+            - table[high[:, a], low[:, b]] + table[low[:, a], low[:, b]]))
+
+
+    def carve_columns(self, start: int, mask: np.ndarray) -> None:
+        # the removed voxels of the x slabs holding the columns, as a table
+        # of counts over [x, y, z] boxes of those slabs
+        res = self.resolution
+        first, last = start // res, (start + len(mask) - 1) // res + 1
+        removed = np.zeros(((last - first) * res, res), dtype=bool)
+        removed[start - first * res:start - first * res + len(mask)] = ~mask
+        removed = removed.reshape(last - first, res, res)
+        table = np.zeros((last - first + 1, res + 1, res + 1), dtype=np.int32)
+        table[1:, 1:, 1:] = removed.cumsum(axis=0).cumsum(axis=1).cumsum(axis=2)
+
+        def count(low: np.ndarray, high: np.ndarray) -> np.ndarray:
+            x0 = np.clip(low[:, 0], first, last) - first
+            x1 = np.clip(high[:, 0], first, last) - first
+            (y0, z0), (y1, z1) = low[:, 1:].T, high[:, 1:].T
+            return (table[x1, y1, z1] - table[x0, y1, z1] - table[x1, y0, z1] - table[x1, y1, z0]
+                + table[x0, y0, z1] + table[x0, y1, z0] + table[x1, y0, z0] - table[x0, y0, z0])
+        self.clip(count)
+
+
+    @staticmethod
+    def summed_area(mask: np.ndarray) -> np.ndarray:
+        """ Number of True cells of mask[:i, :j] at [i, j] """
+        table = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+        table[1:, 1:] = mask.cumsum(axis=0).cumsum(axis=1)
+        return table
+
+
+    def clip(self, removed: Callable[[np.ndarray, np.ndarray], np.ndarray]) -> None:
+        """ Removes some voxels, coarse to fine. removed(low, high) counts
+            the voxels low <= [x, y, z] < high to remove of every box.
+            Leaves that keep all their voxels stay, those that keep none
+            are dropped and the others are subdivided """
+        res = self.resolution
+        cells = np.empty((0, 3), dtype=np.int64)
+        for level in range(self.depth, -1, -1):
+            size = 1 << level
+            cells = np.concatenate([self.leaves[level].astype(np.int64), cells])
+            ends = np.minimum(cells + size, res)
+            count = removed(cells, ends)
+            volume = np.prod(ends - cells, axis=1)
+            self.leaves[level] = cells[count == 0].astype(np.uint16)
+            split = cells[(count > 0) & (count < volume)]
+
+            # children of the partly removed cells, inside the voxel space
+            half = size >> 1
+            cells = (split[:, np.newaxis, :] + CHILDREN * half).reshape(-1, 3)
+            cells = cells[np.all(cells < res, axis=1)]
+
+
+    def carve_views(self, views: list[View],
+        samples: Callable[[Plane, np.ndarray, np.ndarray], np.ndarray]) -> None:
+        """ Carves the octree coarse to fine. A cell is dropped as soon as
+            its footprint on some view lies outside the view polygon, kept
+            as a leaf if it lies inside every polygon, and subdivided only
+            when it crosses some polygon's boundary. samples(plane, i, j)
+            gives the real coordinates of the voxel centers (i, j). The
+            views must be axis-aligned, others are carved by carve_columns """
+        if not all(view.is_axis_aligned() for view in views):
+            raise ValueError('carve_views only takes axis-aligned views')
+
+        res = self.resolution
+        planes = [view.get_view_direction() for view in views]
+        for view in views: shapely.prepare(view.polygon)
+        cells = np.empty((0, 3), dtype=np.int64)
+
+        for level in range(self.depth, -1, -1):
+            size = 1 << level
+            cells = np.concatenate([self.leaves[level].astype(np.int64), cells])
+            keep = np.ones(len(cells), dtype=bool)
+            full = np.ones(len(cells), dtype=bool)
+
+            for view, plane in zip(views, planes):
+                alive = np.flatnonzero(keep)
+                if not len(alive): break
+                inside, outside = self.classify(view, plane, cells[alive], size, samples)
+                keep[alive[outside]] = False
+                full[alive[~inside]] = False
+
+            self.leaves[level] = cells[keep & full].astype(np.uint16)
+            split = cells[keep & ~full]
+            if not level: break
+
+            # children of the crossing cells, inside the voxel space
+            half = size >> 1
+            cells = (split[:, np.newaxis, :] + CHILDREN * half).reshape(-1, 3)
+            cells = cells[np.all(cells < res, axis=1)]
+
+
+    def classify(self, view: View, plane: Plane, cells: np.ndarray, size: int,
+        samples: Callable) -> tuple[np.ndarray, np.ndarray]:
+        """ Returns which cells have all their voxel centers inside the view
+            polygon (first) and which ones have all of them outside """
+        # cells with the same origin along the plane share the footprint,
+        # found with a lookup table over the (aligned) footprints grid
+        a, b = PLANE_AXES[plane]
+        side = -(-self.resolution // size)
+        keys = (cells[:, a] // size) * side + cells[:, b] // size
+        used = np.zeros(side * side, dtype=bool)
+        used[keys] = True
+        inverse = (np.cumsum(used) - 1)[keys]
+        origins = np.stack(np.divmod(np.flatnonzero(used), side), axis=1) * size
+        first = samples(plane, origins[:, 0], origins[:, 1])
+        points = view.real_to_plane_batch(first)
+
+        if size == 1:
+            inside = shapely.contains_xy(view.polygon, points[:, 0], points[:, 1])
+            return inside[inverse], ~inside[inverse]
+
+        # footprint of the first and last voxel centers of every cell
+        ends = np.minimum(origins + size, self.resolution) - 1
+        last = view.real_to_plane_batch(samples(plane, ends[:, 0], ends[:, 1]))
+        low, high = np.minimum(points, last), np.maximum(points, last)
+        footprints = self.footprints(low, high)
+
+        # the boundary of a polygon does not count as inside (contains_xy)
+        inside = shapely.contains_properly(view.polygon, footprints)
+        outside = ~shapely.intersects(view.polygon, footprints)
+        return inside[inverse], outside[inverse]
+
+
+    @staticmethod
+    def footprints(low: np.ndarray, high: np.ndarray) -> np.ndarray:
+        """ Rectangles from low to high corners. Cells one voxel wide
+            become segments or points, so that they stay valid geometries """
+        geometries = shapely.box(low[:, 0], low[:, 1], high[:, 0], high[:, 1])
+        flat = (low[:, 0] == high[:, 0]) | (low[:, 1] == high[:, 1])
+        point = (low[:, 0] == high[:, 0]) & (low[:, 1] == high[:, 1])
+
+        segment = flat & ~point
+        if np.any(segment):
+            coords = np.stack([low[segment], high[segment]], axis=1)
+            geometries[segment] = shapely.linestrings(coords)
+        if np.any(point):
+            geometries[point] = shapely.points(low[point])
+        return geometries
+
+
+    def extents(self, level: int) -> np.ndarray:
+        """ Number of voxels along each axis of the leaves of a level """
+        origins = self.leaves[level].astype(np.int64)
+        return np.minimum(origins + (1 << level), self.resolution) - origins
+
+
+    def count(self) -> int:
+        return int(sum(np.prod(self.extents(level), axis=1).sum()
+            for level in range(self.depth + 1)))
+
+
+    def indices(self) -> np.ndarray:
+        # expands every leaf into its voxels, level by level
+        indices = [self.leaves[0].astype(np.int64)]
+        for level in range(1, self.depth + 1):
+            origins = self.leaves[level].astype(np.int64)
+            if not len(origins): continue
+            size = 1 << level
+            offsets = np.indices((size,)*3).reshape(3, -1).T
+            voxels = (origins[:, np.newaxis, :] + offsets).reshape(-1, 3)
+            indices.append(voxels[np.all(voxels < self.resolution, axis=1)])
+        return np.concatenate(indices)
+
+
+    def slab(self, x: int) -> np.ndarray:
+        # leaves crossing the slab are painted as rectangles, summing
+        # their corners in a difference array
+        res = self.resolution
+        delta = np.zeros((res + 1, res + 1), dtype=np.int64)
+        for level in range(self.depth + 1):
+            origins = self.leaves[level].astype(np.int64)
+            origins = origins[(origins[:, 0] <= x) & (x < origins[:, 0] + (1 << level))]
+            if not len(origins): continue
+            ends = np.minimum(origins + (1 << level), res)
+            np.add.at(delta, (origins[:, 1], origins[:, 2]), 1)
+            np.add.at(delta, (origins[:, 1], ends[:, 2]), -1)
+            np.add.at(delta, (ends[:, 1], origins[:, 2]), -1)
+            np.add.at(delta, (ends[:, 1], ends[:, 2]), 1)
+        return np.cumsum(np.cumsum(delta, axis=0), axis=1)[:res, :res] > 0
+
+
+    @property
+    def nbytes(self) -> int:
+        return sum(leaves.nbytes for leaves in self.leaves)
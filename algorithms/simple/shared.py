@@ -0,0 +1,61 @@
+import weakref
+import numpy as np
+from multiprocessing import shared_memory
+from utils.geo3d import Plane
+from algorithms.simple.grid import PackedGrid, carve_block
+
+# shared memory block, grid shape and view masks of a worker process
+WORKER_GRID: tuple[shared_memory.SharedMemory, tuple, list] | None = None
+
+
+def init_carve_worker(name: str, shape: tuple, masks: list[tuple[Plane, np.ndarray]]) -> None:
+    global WORKER_GRID
+    WORKER_GRID = (shared_memory.SharedMemory(name=name), shape, masks)
+
+
+def carve_slabs(slabs: tuple[int, int]) -> None:
+    """ Carves the x slabs first, ..., last - 1 of the shared grid in place """
+    memory, shape, masks = WORKER_GRID
+    first, last = slabs
+    data = np.ndarray(shape, dtype=np.uint8, buffer=memory.buf)
+    carve_block(data[first:last], first, masks)
+
+
+class SharedGrid(PackedGrid):
+
+    """ PackedGrid in a shared memory block. carve_views splits the grid
+        into ranges of x slabs, carved in place by up to jobs worker
+        processes, each one applying every view to its own slabs. The
+        block is unlinked with the grid """
+    jobs: int
+    memory: shared_memory.SharedMemory
+
+    def __init__(self, resolution: int, jobs: int = 1):
+        self.jobs = jobs
+        super().__init__(resolution)
+
+
+    def allocate(self, shape: tuple) -> np.ndarray:
+        memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape))))
+        self.memory = memory
+        weakref.finalize(self, memory.unlink)
+        return np.ndarray(shape, dtype=np.uint8, buffer=memory.buf)
+
+
+    def carve_views(self, masks: list[tuple[np.ndarray, Plane]]) -> None:
+        """ Carves the masks of several views, over their planes. Every
+            slab gets all of them at once """
+        packed = [(plane, self.pack(mask, plane)) for (mask, plane) in masks]
+        if not packed:
+            return
+        if self.jobs <= 1:
+            carve_block(self.data, 0, packed)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+        bounds = np.linspace(0, self.resolution, min(self.resolution, 4 * self.jobs) + 1).astype(int)
+        slabs = [(int(a), int(b)) for (a, b) in zip(bounds[:-1], bounds[1:]) if b > a]
+        with ProcessPoolExecutor(max_workers=min(self.jobs, len(slabs)),
+            initializer=init_carve_worker,
+            initargs=(self.memory.name, self.data.shape, packed)) as executor:
+            list(executor.map(carve_slabs, slabs))
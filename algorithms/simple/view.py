@@ -1,9 +1,16 @@
 import numpy as np
+from collections import OrderedDict
 from shapely.geometry import Point
 from core.base_view import BaseView
 from shapely import contains_xy
 from utils.geo3d import Plane
 
+# rasterized silhouettes, shared by every model of the process so that
+# parameter sweeps reuse them: (polygon, us, vs) -> raster. The least
+# recently used ones are dropped while they take more than MASKS_BYTES
+MASKS: OrderedDict[bytes, np.ndarray] = OrderedDict()
+MASKS_BYTES = 64 << 20
+
 
 class View(BaseView):
 
@@ -26,16 +33,95 @@ class View(BaseView):
         return { 'x': Plane.YZ, 'y': Plane.XZ, 'z': Plane.XY }[axis]
 
 
-    def real_to_plane_batch(self, points: np.ndarray) -> np.ndarray:
-        """ Vectorized version of view.real_to_plane (points = (n,3) -> (n,2)) """
-        delta = points - self.origin
-        solution = delta @ self.transform_inv.T
-        return solution
+    def is_axis_aligned(self, tol: float = 1e-9) -> bool:
+        """ Checks if Vy is parallel to one of the space axes """
+        direction = np.abs(self.vy) / np.linalg.norm(self.vy)
+        return bool(np.sum(direction > tol) == 1)
+
 
-    
     def points_inside_polygon_batch(self, points_2d: np.ndarray) -> np.ndarray:
         """ Vectorized polygon containement check """
         x = points_2d[:, :, 0].flatten()
         y = points_2d[:, :, 1].flatten()
         mask = contains_xy(self.polygon, x, y)
-        return mask.reshape(points_2d.shape[0], points_2d.shape[1])
\ No newline at end of file
+        return mask.reshape(points_2d.shape[0], points_2d.shape[1])
+
+
+    def points_inside_polygon_grid(self, points_i: np.ndarray, points_j: np.ndarray) -> np.ndarray | None:
+        """ Same as points_inside_polygon_batch for the grid whose [i, 0] and
+            [0, j] points are points_i and points_j, when its coordinates are
+            separable (u only changes along one grid axis and v along the
+            other). The polygon is rasterized once at the grid's columns and
+            rows and the mask is gathered from it. Returns None otherwise """
+        if np.all(points_j[:, 0] == points_j[0, 0]) and np.all(points_i[:, 1] == points_i[0, 1]):
+            us, vs, swap = points_i[:, 0], points_j[:, 1], False
+        elif np.all(points_i[:, 0] == points_i[0, 0]) and np.all(points_j[:, 1] == points_j[0, 1]):
+            us, vs, swap = points_j[:, 0], points_i[:, 1], True
+        else:
+            return None
+
+        key = b''.join([self.polygon.wkb, us.tobytes(), vs.tobytes()])
+        raster = MASKS.get(key)
+        if raster is None:
+            raster = self.rasterize(us, vs)
+            MASKS[key] = raster
+            size = sum(mask.nbytes for mask in MASKS.values())
+            while size > MASKS_BYTES:
+                size -= MASKS.popitem(last=False)[1].nbytes
+        else:
+            MASKS.move_to_end(key)
+        return raster.T if swap else raster
+
+
+    def rasterize(self, us: np.ndarray, vs: np.ndarray) -> np.ndarray:
+        """ Scanline rasterization of the polygon at the points (us[i], vs[j]).
+            Like contains_xy, points on the polygon's boundary are outside """
+        rings = [self.polygon.exterior, *self.polygon.interiors]
+        edges = np.concatenate([np.column_stack([
+            np.asarray(ring.coords)[:-1], np.asarray(ring.coords)[1:]])
+            for ring in rings])
+
+        # the scanlines are processed in blocks of (rows x edges) cells
+        order = np.argsort(us, kind='stable')
+        raster = np.empty((len(us), len(vs)), dtype=bool)
+        rows = max(1, (1 << 22) // len(edges))
+        for start in range(0, len(vs), rows):
+            block = self.scanlines(edges, us[order], vs[start:start + rows])
+            raster[order, start:start + rows] = block.T
+        return raster
+
+
+    @staticmethod
+    def scanlines(edges: np.ndarray, us: np.ndarray, vs: np.ndarray) -> np.ndarray:
+        """ Inside test of the points (us[i], vs[j]) for sorted us, as a
+            (len(vs), len(us)) mask. Even-odd rule with half-open edges """
+        x0, y0, x1, y1 = edges.T
+        v = vs[:, np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            at = x0 + (v - y0) * (x1 - x0) / (y1 - y0)
+        # exact u at the end points of the edges
+        at = np.where(y1 == v, x1, np.where(y0 == v, x0, at))
+
+        # a crossing at u toggles every point of the row with u' >= u
+        row, edge = np.nonzero((y0 <= v) != (y1 <= v))
+        first = np.searchsorted(us, at[row, edge], side='left')
+        toggles = np.zeros((len(vs), len(us) + 1), dtype=np.uint8)
+        np.bitwise_xor.at(toggles, (row, first), 1)
+        inside = np.bitwise_xor.accumulate(toggles, axis=1)[:, :-1].view(bool)
+
+        # boundary points: edge crossings and vertices...
+        touches = (np.minimum(y0, y1) <= v) & (np.maximum(y0, y1) >= v)
+        flat = y0 == y1
+        row, edge = np.nonzero(touches & ~flat)
+        u = at[row, edge]
+        first = np.minimum(np.searchsorted(us, u, side='left'), len(us) - 1)
+        hit = us[first] == u
+        inside[row[hit], first[hit]] = False
+
+        # ...and horizontal edges, which only touch a few rows
+        row, edge = np.nonzero(touches & flat)
+        first = np.searchsorted(us, np.minimum(x0, x1)[edge], side='left')
+        last = np.searchsorted(us, np.maximum(x0, x1)[edge], side='right')
+        for (r, a, b) in zip(row.tolist(), first.tolist(), last.tolist()):
+            inside[r, a:b] = False
+        return inside
@@ -0,0 +1,173 @@
+import contextlib
+import importlib
+import itertools
+import json
+import glob
+import time
+import io
+import os
+from pathlib import Path
+from main import discover_algorithms
+
+
+def parse_grid(values: list[str], params: dict, algorithm: str,
+    known: set[str] = frozenset()) -> dict[str, list]:
+    """ Parses name=v1,v2,... items into the values of each parameter of
+        algorithm, converted with their declared type. Names in known (the
+        parameters of the other algorithms of the batch) are skipped, and
+        missing parameters take their default value """
+    grid = {name: [config['default']] for (name, config) in params.items()
+        if config.get('default') is not None}
+    for item in values:
+        name, _, raw = item.partition('=')
+        name = name.replace('-', '_')
+        if not raw:
+            raise ValueError(f'Expected name=value[,value...], got: {item}')
+        if name not in params:
+            if name in known: continue
+            raise ValueError(f'Unknown parameter {name} for {algorithm}')
+        config = params[name]
+        converted = [config['type'](value) for value in raw.split(',')]
+        for value in converted:
+            if config.get('choices') and value not in config['choices']:
+                raise ValueError(f'Invalid value for {name}: {value}')
+        grid[name] = converted
+    return grid
+
+
+def expand_grid(grid: dict[str, list]) -> list[dict]:
+    """ Every combination of the parameter values """
+    names = sorted(grid)
+    return [dict(zip(names, values))
+        for values in itertools.product(*(grid[n] for n in names))]
+
+
+def job_name(params: dict) -> str:
+    """ File name (without suffix) of the results of a job """
+    return '_'.join(f'{k}={v}' for (k, v) in sorted(params.items())) or 'default'
+
+
+def run_job(path: str, module_name: str, params: dict, output: str,
+    contour: str, cache: bool) -> dict:
+    """ Reconstructs one model and writes its results to output. Returns
+        the job record: stage timings (seconds) and status. Runs in a
+        worker process, its standard output goes to a log file """
+    from core.view_cache import ViewCache
+    module = importlib.import_module(module_name)
+    record = {
+        'model': path,
+        'algorithm': module.ALGORITHM_NAME,
+        'params': params,
+        'status': 'ok',
+        'timings': {},
+    }
+
+    target = Path(output, Path(path).name, module.ALGORITHM_NAME)
+    target.mkdir(parents=True, exist_ok=True)
+    name = job_name(params)
+    log = io.StringIO()
+
+    try:
+        with contextlib.redirect_stdout(log):
+            start = time.perf_counter()
+            model = module.Model(path, contour=contour,
+                cache=ViewCache() if cache else None, jobs=1, **params)
+            record['timings']['load_views'] = time.perf_counter() - start
+
+            for stage in ('initial_reconstruction', 'refine_model', 'generate_surface'):
+                start = time.perf_counter()
+                getattr(model, stage)()
+                record['timings'][stage] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            model.export_model(target.joinpath(name + '.npz'))
+            record['timings']['export_model'] = time.perf_counter() - start
+            record['result'] = str(target.joinpath(name + '.npz'))
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = f'{type(e).__name__}: {e}'
+
+    record['total'] = sum(record['timings'].values())
+    target.joinpath(name + '.log').write_text(log.getvalue())
+    return record
+
+
+if __name__ == '__main__':
+
+    import sys
+    from argparse import ArgumentParser
+    from core import CONTOUR_BACKENDS
+
+    algorithms = discover_algorithms()
+    if not algorithms: sys.exit('[!] No algorithms found!')
+
+    parser = ArgumentParser(description='3D Object Reconstruction (headless batch mode)')
+    parser.add_argument('-m', '--models', type=str, nargs='+', required=True,
+        help='Model directories or glob patterns, e.g. "models/*"')
+    parser.add_argument('-a', '--algorithm', type=str, nargs='+', required=True,
+        help='Algorithms used for every model', choices=list(algorithms.keys()))
+    parser.add_argument('-P', '--param', type=str, action='append', default=[],
+        help='Parameter values of the grid, as name=v1,v2,... (may be repeated)')
+    parser.add_argument('-o', '--output', type=str, required=True,
+        help='Directory where results and timings are written')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+        help='Number of worker processes running the jobs (0 = one per CPU), '
+            'every job runs with one worker')
+    parser.add_argument('-c', '--contour', type=str, default='native',
+        help='Contour extraction backend used to load the views',
+        choices=CONTOUR_BACKENDS)
+    parser.add_argument('--no-cache', action='store_true',
+        help='Do not read or write the parsed views cache')
+    args = parser.parse_args()
+
+    # model directories, from paths or glob patterns
+    models = sorted({m for pattern in args.models
+        for m in (glob.glob(pattern) or [pattern]) if Path(m).is_dir()})
+    if not models: sys.exit('[!] No models found!')
+    names = [Path(m).name for m in models]
+    if len(set(names)) != len(names):
+        sys.exit('[!] Model directories must have different names')
+
+    # one job per model, algorithm and parameters combination
+    jobs = []
+    known = {name for algorithm in args.algorithm for name in algorithms[algorithm]['params']}
+    try:
+        for algorithm in args.algorithm:
+            info = algorithms[algorithm]
+            grid = parse_grid(args.param, info['params'], algorithm, known)
+            for params in expand_grid(grid):
+                jobs += [(m, info['module'].__name__, params) for m in models]
+    except ValueError as e:
+        sys.exit(f'[!] {e}')
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    workers = args.jobs or os.cpu_count() or 1
+    print(f'[+] Running {len(jobs)} jobs with {workers} workers')
+
+    # records are appended as soon as each job finishes
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    records = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+        output.joinpath('results.jsonl').open('a') as results:
+        futures = [executor.submit(run_job, m, module, params, args.output,
+            args.contour, not args.no_cache) for (m, module, params) in jobs]
+
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            results.write(json.dumps(record) + '\n')
+            results.flush()
+            status = record['status'] if record['status'] == 'ok' else record['error']
+            print(f'[{len(records)}/{len(jobs)}] {record["model"]} {record["algorithm"]} '
+                f'{job_name(record["params"])}: {record["total"] * 1000:.2f} ms ({status})')
+
+    from tabulate import tabulate
+    elapsed = time.perf_counter() - start
+    failed = [r for r in records if r['status'] != 'ok']
+    stages = sorted({stage for r in records for stage in r['timings']})
+    table = [[stage, sum(r['timings'].get(stage, 0) for r in records)] for stage in stages]
+    print(tabulate(table, headers=['Stage', 'Total (s)'], tablefmt='github'))
+    print(f'[+] {len(records) - len(failed)} jobs done, {len(failed)} failed, in {elapsed:.2f} s')
+    if failed: sys.exit(1)
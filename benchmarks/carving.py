@@ -0,0 +1,58 @@
+""" Scaling of the shared memory carving of the simple algorithm, from 1
+    to N worker processes, each one carving its own slabs with every view.
+    The timings are the ones of refine_model (cached masks + carving,
+    including the start of the processes), packed is the serial reference.
+
+    python -m benchmarks.carving [-m models] [-r 256 512 1024] [-j 1 2 ... N] [-n repeat] """
+from argparse import ArgumentParser
+from pathlib import Path
+import os
+import time
+import numpy as np
+from tabulate import tabulate
+from algorithms.simple.model import Model
+
+
+def refine(model: Model, storage: str, jobs: int = 1) -> tuple[float, np.ndarray]:
+    """ Wall time (ms) and resulting packed voxels of refine_model """
+    model.storage = storage
+    model.jobs = jobs
+    model.initial_reconstruction()
+    start = time.perf_counter()
+    model.refine_model()
+    return (time.perf_counter() - start) * 1000, model.voxel_space.data.copy()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Shared memory carving scaling benchmark')
+    parser.add_argument('-m', '--models', type=str, default='models',
+        help='Directory with the models to benchmark')
+    parser.add_argument('-r', '--resolutions', type=int, nargs='+',
+        default=[256, 512, 1024])
+    parser.add_argument('-j', '--jobs', type=int, nargs='+',
+        default=list(range(1, (os.cpu_count() or 1) + 1)),
+        help='Worker processes measured, 1 to the number of CPUs by default')
+    parser.add_argument('-n', '--repeat', type=int, default=3,
+        help='Runs per measure, the best one is kept')
+    args = parser.parse_args()
+
+    rows = []
+    for path in sorted(p for p in Path(args.models).iterdir() if p.is_dir()):
+        model = Model(str(path), args.resolutions[0])
+        for res in args.resolutions:
+            model.resolution = res
+            # the first run fills the mask cache
+            packed_ms, expected = min((refine(model, 'packed') for _ in range(args.repeat + 1)),
+                key=lambda run: run[0])
+            base_ms = None
+            for jobs in args.jobs:
+                runs = [refine(model, 'shared', jobs) for _ in range(args.repeat)]
+                shared_ms = min(ms for (ms, _) in runs)
+                base_ms = base_ms or shared_ms
+                same = all(np.array_equal(data, expected) for (_, data) in runs)
+                rows.append([path.name, res, jobs, f'{packed_ms:.3f}', f'{shared_ms:.3f}',
+                    f'{base_ms / shared_ms:.2f}x', f'{base_ms / shared_ms / jobs:.0%}', same])
+
+    headers = ['Model', 'Resolution', 'Workers', 'Packed (ms)', 'Shared (ms)',
+        'Speedup', 'Efficiency', 'Equal']
+    print(tabulate(rows, headers=headers, tablefmt='github'))
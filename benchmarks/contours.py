@@ -0,0 +1,48 @@
+""" Checks that the contour backends of BaseView agree: the native vertex
+    list must be identical to the walker's for the plane.bmp of every view
+    of every model. Fails (exit code 1) on any difference, and reports the
+    time of each backend.
+
+    python -m benchmarks.contours [-m models] [-n repeat] """
+from argparse import ArgumentParser
+from pathlib import Path
+import time
+import sys
+import numpy as np
+from core.base_view import BaseView
+
+
+def extract(path: Path, contour: str) -> tuple[float, np.ndarray]:
+    """ Wall time (ms) and polygon vertices of a view, without cache """
+    start = time.perf_counter()
+    view = BaseView(path, contour)
+    return (time.perf_counter() - start) * 1000, np.asarray(view.polygon.exterior.coords)
+
+
+if __name__ == '__main__':
+    from tabulate import tabulate
+    parser = ArgumentParser(description='Contour backends parity check')
+    parser.add_argument('-m', '--models', type=str, default='models',
+        help='Directory with the models to check')
+    parser.add_argument('-n', '--repeat', type=int, default=1,
+        help='Runs per measure, the best one is kept')
+    args = parser.parse_args()
+
+    rows, failures = [], []
+    for image in sorted(Path(args.models).glob('*/*/plane.bmp')):
+        path = image.parent
+        walker_ms, walker = min((extract(path, 'walker') for _ in range(args.repeat)),
+            key=lambda run: run[0])
+        native_ms, native = min((extract(path, 'native') for _ in range(args.repeat)),
+            key=lambda run: run[0])
+        same = walker.shape == native.shape and np.array_equal(walker, native)
+        rows.append([path.parent.name, path.name, len(native) - 1,
+            f'{walker_ms:.2f}', f'{native_ms:.2f}', same])
+        if not same:
+            failures.append(f'{path}: {len(native) - 1} native vertices, {len(walker) - 1} walker vertices')
+
+    headers = ['Model', 'View', 'Vertices', 'Walker (ms)', 'Native (ms)', 'Equal']
+    print(tabulate(rows, headers=headers, tablefmt='github'))
+    for failure in failures: print(f'[!] {failure}')
+    print(f'[+] {len(rows) - len(failures)} views passed, {len(failures)} failed')
+    if failures or not rows: sys.exit(1)
@@ -0,0 +1,246 @@
+""" Golden outputs: captures reference reconstructions of every model (the
+    voxel space of simple as a packed bitmap, the plane polygons of
+    complex as vertex arrays) and checks the current code against them,
+    by voxel IoU, Hausdorff distance (voxels) and polygon areas.
+
+    python -m benchmarks.golden capture [-m models] [-r 64] [-s 1.0]
+    python -m benchmarks.golden check [-m models]
+        [--storage dense|packed|octree|intervals|mapped|shared] [--mask raster|shapely]
+        [--refine array|loop|parallel] [--merge none|union] [--slicing uniform|adaptive]
+        [--iou 0.999] [--hausdorff 1.0] [--area 0.01] """
+from argparse import ArgumentParser
+from pathlib import Path
+import time
+import sys
+import numpy as np
+import cv2
+
+REFERENCES = 'benchmarks/references'
+
+
+def dense_voxels(grid) -> np.ndarray:
+    """ Active voxels of any VoxelGrid as a dense boolean array """
+    if hasattr(grid, 'data') and grid.data.dtype == bool:
+        return grid.data
+    return np.stack([grid.slab(x) for x in range(grid.resolution)])
+
+
+def packed_indices(bits: np.ndarray, shape: tuple) -> np.ndarray:
+    """ (n, 3) indices of the set bits of np.packbits(array of shape) """
+    nonzero = np.flatnonzero(bits)
+    bit = np.flatnonzero(np.unpackbits(bits[nonzero][:, np.newaxis], axis=1))
+    flat = nonzero[bit // 8] * 8 + bit % 8
+    return np.stack(np.unravel_index(flat, shape), axis=1)
+
+
+def directed_hausdorff(query: np.ndarray, b: np.ndarray) -> float:
+    """ Largest distance (in voxels) from the query voxels, (n, 3) indices
+        outside b, to their nearest voxel of b. For every x slice of b, an
+        exact 2D distance transform gives their in-slice distance, and
+        slices are visited by increasing x gap until none can be nearer """
+    if not len(query):
+        return 0.0
+    slices = np.flatnonzero(b.reshape(len(b), -1).any(axis=1))
+    if not len(slices):
+        return float('inf')
+
+    # lower bound of the x gap between each slice and the queried voxels
+    xs = np.unique(query[:, 0])
+    pos = np.clip(np.searchsorted(xs, slices), 1, len(xs)) - 1
+    gap = np.minimum(np.abs(slices - xs[pos]),
+        np.abs(slices - xs[np.minimum(pos + 1, len(xs) - 1)]))
+    order = np.argsort(gap, kind='stable')
+
+    best = np.full(len(query), np.inf)
+    for (s, g) in zip(slices[order], gap[order]):
+        if g * g >= best.max(): break
+        # distance to the nearest zero pixel: the voxels of b
+        distance = cv2.distanceTransform((~b[s]).view(np.uint8),
+            cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+        d2 = distance[query[:, 1], query[:, 2]].astype(float) ** 2 + (query[:, 0] - s) ** 2
+        np.minimum(best, d2, out=best)
+    return float(np.sqrt(best.max()))
+
+
+def compare_voxels(a: np.ndarray, b: np.ndarray) -> dict:
+    """ IoU and symmetric Hausdorff distance (voxels) of two voxel sets.
+        Both are packed once, only the differing voxels are unpacked """
+    pa, pb = np.packbits(a), np.packbits(b)
+    union = int(np.bitwise_count(pa | pb).sum())
+    inter = int(np.bitwise_count(pa & pb).sum())
+    only_a = packed_indices(pa & ~pb, a.shape)
+    only_b = packed_indices(pb & ~pa, b.shape)
+    return {
+        'iou': inter / union if union else 1.0,
+        'hausdorff': max(directed_hausdorff(only_a, b), directed_hausdorff(only_b, a)),
+    }
+
+
+def polygon_areas(vertices: np.ndarray, offsets: np.ndarray, normals: np.ndarray,
+    plane_index: np.ndarray, rings: np.ndarray | None = None) -> np.ndarray:
+    """ Area of every polygon of flat (vertices, offsets, rings) arrays,
+        projected along the normal axis of its plane (shoelace formula).
+        The first ring of a polygon is its exterior, the rest are holes """
+    if not len(plane_index):
+        return np.empty(0)
+    if rings is None:
+        rings = np.arange(len(plane_index) + 1)
+    polygon = np.repeat(np.arange(len(plane_index)), np.diff(rings))
+    ring = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    axis = np.argmax(np.abs(normals), axis=1)[plane_index][polygon][ring]
+    u = np.where(axis == 0, vertices[:, 1], vertices[:, 0])
+    v = np.where(axis == 2, vertices[:, 1], vertices[:, 2])
+
+    # next vertex of every vertex, inside its own ring
+    following = np.arange(1, len(vertices) + 1)
+    following[offsets[1:] - 1] = offsets[:-1]
+    cross = u * v[following] - u[following] * v
+    areas = np.abs(np.add.reduceat(cross, offsets[:-1])) / 2
+    areas[np.setdiff1d(np.arange(len(areas)), rings[:-1])] *= -1
+    return np.add.reduceat(areas, rings[:-1])
+
+
+def compare_planes(reference: dict, candidate: dict, interpolate: bool = False) -> dict:
+    """ Compares the polygons of two complex reconstructions (export_model
+        arrays) plane by plane: planes present in only one of them and the
+        largest difference of total polygon area, absolute and relative.
+        With interpolate (adaptive slicing), the candidate plane areas are
+        linearly interpolated at the reference planes it skipped """
+    totals = []
+    for data in (reference, candidate):
+        areas = polygon_areas(data['vertices'], data['offsets'],
+            data['plane_normals'], data['plane_index'], data.get('rings'))
+        per_plane = np.bincount(data['plane_index'], weights=areas,
+            minlength=len(data['plane_keys']))
+        totals.append(dict(zip(np.round(data['plane_keys'], 6).tolist(), per_plane)))
+
+    if interpolate and totals[1]:
+        known = sorted(totals[1])
+        areas = np.interp(sorted(totals[0]), known, [totals[1][k] for k in known], left=0, right=0)
+        totals[1] = {**dict(zip(sorted(totals[0]), areas)), **totals[1]}
+
+    keys = sorted(set(totals[0]) | set(totals[1]))
+    old = np.array([totals[0].get(k, 0.0) for k in keys])
+    new = np.array([totals[1].get(k, 0.0) for k in keys])
+    difference = np.abs(new - old)
+    return {
+        'missing_planes': len(set(totals[0]) ^ set(totals[1])),
+        'area_difference': float(difference.max()) if len(keys) else 0.0,
+        'area_relative': float(difference.sum() / max(old.sum(), 1e-12)),
+    }
+
+
+def reference_path(model: Path, algorithm: str, value) -> Path:
+    return Path(REFERENCES, model.name, f'{algorithm}-{value}.npz')
+
+
+def reconstruct(model: Path, algorithm: str, **params):
+    """ Runs the reconstruction chain of an algorithm, quietly """
+    import contextlib, io, importlib
+    module = importlib.import_module(f'algorithms.{algorithm}')
+    with contextlib.redirect_stdout(io.StringIO()):
+        built = module.Model(str(model), cache=None, **params)
+        built.initial_reconstruction()
+        built.refine_model()
+    return built
+
+
+def capture(args) -> None:
+    import tempfile
+    for model in sorted(p for p in Path(args.models).iterdir() if p.is_dir()):
+        # references use the reference paths: dense storage, shapely masks
+        simple = reconstruct(model, 'simple', resolution=args.resolution,
+            storage='dense', mask='shapely')
+        voxels = dense_voxels(simple.voxel_space)
+        path = reference_path(model, 'simple', args.resolution)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, resolution=args.resolution,
+            bounds=np.array(simple.bounds), bits=np.packbits(voxels))
+
+        built = reconstruct(model, 'complex', step=args.step)
+        with tempfile.TemporaryDirectory() as directory:
+            temp = Path(directory, 'complex.npz')
+            built.export_model(temp)
+            reference_path(model, 'complex', args.step).write_bytes(temp.read_bytes())
+        print(f'[+] {model.name}: {int(voxels.sum())} voxels, '
+            f'{built.planes.n_polygons} polygons')
+
+
+def check(args) -> bool:
+    """ Checks every stored reference. Returns whether all pass """
+    import tempfile
+    from tabulate import tabulate
+    rows, failures = [], 0
+
+    for path in sorted(Path(REFERENCES).glob('*/*.npz')):
+        model = Path(args.models, path.parent.name)
+        algorithm, _, value = path.stem.partition('-')
+        reference = np.load(path)
+
+        if algorithm == 'simple':
+            res = int(reference['resolution'])
+            built = reconstruct(model, 'simple', resolution=res,
+                storage=args.storage, mask=args.mask)
+            start = time.perf_counter()
+            expected = np.unpackbits(reference['bits'], count=res ** 3).view(bool).reshape((res,)*3)
+            metrics = compare_voxels(expected, dense_voxels(built.voxel_space))
+            passed = metrics['iou'] >= args.iou and metrics['hausdorff'] <= args.hausdorff
+            shown = f'iou={metrics["iou"]:.6f} hausdorff={metrics["hausdorff"]:.3f}'
+        else:
+            built = reconstruct(model, 'complex', step=float(value),
+                refine=args.refine, merge=args.merge, slicing=args.slicing)
+            with tempfile.TemporaryDirectory() as directory:
+                temp = Path(directory, 'complex.npz')
+                built.export_model(temp)
+                candidate = dict(np.load(temp))
+            start = time.perf_counter()
+            metrics = compare_planes(dict(reference), candidate, args.slicing == 'adaptive')
+            passed = not metrics['missing_planes'] and metrics['area_relative'] <= args.area
+            shown = (f'missing={metrics["missing_planes"]} max_area={metrics["area_difference"]:.4f} '
+                f'relative={metrics["area_relative"]:.2%}')
+
+        elapsed = (time.perf_counter() - start) * 1000
+        failures += not passed
+        rows.append([model.name, path.stem, shown, f'{elapsed:.2f}', 'ok' if passed else 'FAIL'])
+
+    print(tabulate(rows, headers=['Model', 'Reference', 'Metrics', 'Compare (ms)', 'Status'],
+        tablefmt='github'))
+    print(f'[+] {len(rows) - failures} references passed, {failures} failed')
+    return failures == 0
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Golden outputs of the reconstruction algorithms')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    capture_parser = commands.add_parser('capture', help='Store the reference outputs')
+    capture_parser.add_argument('-m', '--models', type=str, default='models')
+    capture_parser.add_argument('-r', '--resolution', type=int, default=64,
+        help='Resolution of the simple references')
+    capture_parser.add_argument('-s', '--step', type=float, default=1.0,
+        help='Step of the complex references')
+
+    check_parser = commands.add_parser('check', help='Compare the current outputs with the references')
+    check_parser.add_argument('-m', '--models', type=str, default='models')
+    check_parser.add_argument('--storage', type=str, default='dense',
+        choices=['dense', 'packed', 'octree', 'intervals', 'mapped', 'shared'], help='simple voxel storage checked')
+    check_parser.add_argument('--mask', type=str, default='raster',
+        choices=['raster', 'shapely'], help='simple mask engine checked')
+    check_parser.add_argument('--refine', type=str, default='array',
+        choices=['array', 'loop', 'parallel'], help='complex refinement checked')
+    check_parser.add_argument('--merge', type=str, default='none',
+        choices=['none', 'union'], help='complex plane merging checked')
+    check_parser.add_argument('--slicing', type=str, default='uniform',
+        choices=['uniform', 'adaptive'], help='complex slicing checked')
+    check_parser.add_argument('--iou', type=float, default=0.999,
+        help='Minimum voxel IoU')
+    check_parser.add_argument('--hausdorff', type=float, default=1.0,
+        help='Maximum Hausdorff distance, in voxels')
+    check_parser.add_argument('--area', type=float, default=0.01,
+        help='Maximum relative difference of the polygons area')
+    args = parser.parse_args()
+
+    if args.command == 'capture':
+        capture(args)
+    elif not check(args):
+        sys.exit(1)
@@ -0,0 +1,49 @@
+""" Compares the view mask engines of the simple algorithm: shapely
+    contains_xy over every grid point against the rasterized silhouettes.
+    The timings are the ones of refine_model (masks + dense carving).
+
+    python -m benchmarks.masks [-m models] [-r 16 32 ... 1024] [-n repeat] """
+from argparse import ArgumentParser
+from pathlib import Path
+import time
+import numpy as np
+from tabulate import tabulate
+from algorithms.simple.model import Model
+import algorithms.simple.view as simple_view
+
+
+def refine(model: Model, mask: str, cached: bool = True) -> tuple[float, np.ndarray]:
+    """ Wall time (ms) and resulting voxels of refine_model """
+    if not cached: simple_view.MASKS.clear()
+    model.mask = mask
+    model.initial_reconstruction()
+    start = time.perf_counter()
+    model.refine_model()
+    return (time.perf_counter() - start) * 1000, model.voxel_space.data
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='View mask engines benchmark')
+    parser.add_argument('-m', '--models', type=str, default='models',
+        help='Directory with the models to benchmark')
+    parser.add_argument('-r', '--resolutions', type=int, nargs='+',
+        default=[16, 32, 64, 128, 256, 512, 1024])
+    parser.add_argument('-n', '--repeat', type=int, default=3,
+        help='Runs per measure, the best one is kept')
+    args = parser.parse_args()
+
+    rows = []
+    for path in sorted(p for p in Path(args.models).iterdir() if p.is_dir()):
+        model = Model(str(path), args.resolutions[0])
+        for res in args.resolutions:
+            model.resolution = res
+            shapely_ms = min(refine(model, 'shapely')[0] for _ in range(args.repeat))
+            raster_ms = min(refine(model, 'raster', False)[0] for _ in range(args.repeat))
+            cached_ms = min(refine(model, 'raster')[0] for _ in range(args.repeat))
+            same = np.array_equal(refine(model, 'shapely')[1], refine(model, 'raster')[1])
+            rows.append([path.name, res, f'{shapely_ms:.3f}', f'{raster_ms:.3f}',
+                f'{cached_ms:.3f}', f'{shapely_ms / raster_ms:.1f}x', same])
+
+    headers = ['Model', 'Resolution', 'contains_xy (ms)', 'Raster (ms)',
+        'Cached raster (ms)', 'Speedup', 'Equal']
+    print(tabulate(rows, headers=headers, tablefmt='github'))
@@ -0,0 +1,97 @@
+""" Checks the greedy mesh of the simple algorithm on every model: it must
+    be watertight (every edge shared by exactly two triangles, with opposite
+    directions), enclose the voxel count times the voxel volume and have
+    fewer quads than exposed voxel faces. Fails (exit code 1) otherwise.
+
+    python -m benchmarks.mesh [-m models] [-r 32 64 ...] """
+from argparse import ArgumentParser
+from pathlib import Path
+import sys
+import numpy as np
+from algorithms.simple.model import Model
+from algorithms.simple.mesh import Mesh
+
+
+def lattice(mesh: Mesh, bounds: tuple, resolution: int) -> np.ndarray:
+    """ Triangles, (t, 3, 3), as integer voxel corner coordinates """
+    a, b = np.array(bounds[0::2], dtype=float), np.array(bounds[1::2], dtype=float)
+    size = (b - a) / resolution
+    corners = np.rint((mesh.vertices - (a - size / 2)) / size).astype(np.int64)
+    return corners[mesh.indices.astype(np.int64)]
+
+
+def open_edges(triangles: np.ndarray, resolution: int) -> int:
+    """ Number of edges not shared by exactly two triangles with opposite
+        directions. The quads of the greedy mesh meet at T-junctions, so
+        their sides are split into voxel edges: each one must be covered
+        once in each direction. The diagonals are not split """
+    start = triangles.reshape(-1, 3)
+    end = triangles[:, [1, 2, 0]].reshape(-1, 3)
+    delta = end - start
+    aligned = np.count_nonzero(delta, axis=1) == 1
+    side = resolution + 1
+    key = lambda p: (p[:, 0] * side + p[:, 1]) * side + p[:, 2]
+
+    # voxel edges of the sides, as (lowest corner, axis) and direction
+    axis = np.argmax(delta[aligned] != 0, axis=1)
+    step = delta[aligned][np.arange(len(axis)), axis]
+    length = np.abs(step)
+    low = np.minimum(start[aligned], end[aligned])
+    offsets = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+    corner = np.repeat(low, length, axis=0)
+    corner[np.arange(len(corner)), np.repeat(axis, length)] += offsets
+    edges = key(corner) * 3 + np.repeat(axis, length)
+    forward = np.repeat(step > 0, length)
+
+    # diagonals, as (first, second) corners, sorted
+    first, second = key(start[~aligned]), key(end[~aligned])
+    diagonals = np.minimum(first, second) * side ** 3 + np.maximum(first, second)
+
+    failures = 0
+    for (keys, direction) in ((edges, forward), (diagonals, first < second)):
+        _, inverse = np.unique(keys, return_inverse=True)
+        ahead = np.bincount(inverse, weights=direction)
+        behind = np.bincount(inverse, weights=~direction)
+        failures += int(np.count_nonzero((ahead != 1) | (behind != 1)))
+    return failures
+
+
+def volume(triangles: np.ndarray) -> int:
+    """ Enclosed volume in voxels (divergence theorem), exact """
+    p0, p1, p2 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    six = np.einsum('ij,ij->', p0, np.cross(p1, p2))
+    return int(six) // 6
+
+
+if __name__ == '__main__':
+    from tabulate import tabulate
+    parser = ArgumentParser(description='Greedy mesh checks')
+    parser.add_argument('-m', '--models', type=str, default='models',
+        help='Directory with the models to check')
+    parser.add_argument('-r', '--resolutions', type=int, nargs='+', default=[32, 64])
+    args = parser.parse_args()
+
+    rows, failures = [], []
+    for path in sorted(p for p in Path(args.models).iterdir() if p.is_dir()):
+        model = Model(str(path), args.resolutions[0], storage='packed')
+        for res in args.resolutions:
+            model.resolution = res
+            model.initial_reconstruction().refine_model().generate_surface()
+            mesh, voxels = model.mesh, model.voxel_space.count()
+            triangles = lattice(mesh, model.bounds, res)
+            edges, enclosed = open_edges(triangles, res), volume(triangles)
+            rows.append([path.name, res, voxels, enclosed, mesh.faces, mesh.quads, edges])
+
+            name = f'{path.name} (resolution {res})'
+            if edges:
+                failures.append(f'{name}: {edges} edges not shared by exactly two triangles')
+            if enclosed != voxels:
+                failures.append(f'{name}: encloses {enclosed} voxels instead of {voxels}')
+            if voxels and mesh.quads >= mesh.faces:
+                failures.append(f'{name}: {mesh.quads} quads for {mesh.faces} voxel faces')
+
+    headers = ['Model', 'Resolution', 'Voxels', 'Enclosed volume', 'Voxel faces', 'Quads', 'Open edges']
+    print(tabulate(rows, headers=headers, tablefmt='github'))
+    for failure in failures: print(f'[!] {failure}')
+    print(f'[+] {len(rows)} meshes checked, {len(failures)} failures')
+    if failures: sys.exit(1)
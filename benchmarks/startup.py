@@ -0,0 +1,77 @@
+""" Measures the startup of the entry points: wall time of --help and the
+    modules imported by it (python -X importtime). Fails (exit code 1) if
+    a heavy dependency is imported or the time budget is exceeded, so
+    startup regressions are caught.
+
+    python -m benchmarks.startup [-n repeat] [--budget ms] """
+from argparse import ArgumentParser
+import subprocess
+import time
+import sys
+
+# entry points, and the command line used to start each one
+COMMANDS = {
+    'main.py': [sys.executable, 'main.py', '-h'],
+    'batch.py': [sys.executable, 'batch.py', '-h'],
+}
+
+# dependencies that must not be imported just to start the program
+HEAVY = ('pyray', 'raylib', 'cv2', 'shapely', 'numpy', 'tabulate')
+
+
+def wall_time(command: list[str]) -> float:
+    """ Wall time (ms) of a command """
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def imports(command: list[str]) -> dict[str, tuple[float, bool]]:
+    """ Cumulative import time (ms) of every module imported by a command,
+        and whether it was imported at the top level (not by another
+        module), from the -X importtime report """
+    command = [command[0], '-X', 'importtime'] + command[1:]
+    process = subprocess.run(command, check=True, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, text=True)
+
+    modules = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.rstrip()[1:]
+        modules[name.strip()] = (int(cumulative) / 1000, not name.startswith(' '))
+    return modules
+
+
+if __name__ == '__main__':
+    from tabulate import tabulate
+    parser = ArgumentParser(description='Startup time benchmark')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+        help='Runs per measure, the best one is kept')
+    parser.add_argument('--budget', type=float, default=None,
+        help='Maximum wall time (ms) of each entry point')
+    args = parser.parse_args()
+
+    baseline = min(wall_time([sys.executable, '-c', 'pass']) for _ in range(args.repeat))
+    rows, failures = [], []
+
+    for (name, command) in COMMANDS.items():
+        best = min(wall_time(command) for _ in range(args.repeat))
+        modules = imports(command)
+        heavy = sorted({m.split('.')[0] for m in modules} & set(HEAVY))
+        top = [(m, ms) for (m, (ms, top_level)) in modules.items() if top_level]
+        slowest = max(top, key=lambda m: m[1], default=('-', 0))
+        rows.append([name, f'{best:.1f}', f'{best - baseline:.1f}',
+            f'{slowest[0]} ({slowest[1]:.1f} ms)', ', '.join(heavy) or '-'])
+
+        if heavy:
+            failures.append(f'{name} imports {", ".join(heavy)}')
+        if args.budget is not None and best > args.budget:
+            failures.append(f'{name} starts in {best:.1f} ms (budget {args.budget} ms)')
+
+    headers = ['Entry point', 'Wall (ms)', 'Over python (ms)', 'Slowest import', 'Heavy imports']
+    print(tabulate(rows, headers=headers, tablefmt='github'))
+    print(f'Python interpreter startup: {baseline:.1f} ms')
+    for failure in failures: print(f'[!] {failure}')
+    if failures: sys.exit(1)
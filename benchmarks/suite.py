@@ -0,0 +1,198 @@
+""" Benchmark suite: runs every algorithm over the models, sweeping the
+    resolution (simple) and the step (complex). Each case runs in its own
+    process, recording the time of every stage (best of n), the peak RSS
+    and the size of the exported model. Runs are appended to a history
+    file, and compare flags the cases that got worse between two runs.
+
+    python -m benchmarks.suite run [-m models] [-r 16 32 ...] [-s 4 2 ...]
+    python -m benchmarks.suite compare [--base -2] [--head -1] [-t 0.1] """
+from argparse import ArgumentParser
+from pathlib import Path
+import subprocess
+import tempfile
+import datetime
+import platform
+import json
+import sys
+
+HISTORY = 'benchmarks/history.jsonl'
+STAGES = ('load_views', 'initial_reconstruction', 'refine_model',
+    'generate_surface', 'export_model')
+
+# swept parameter of each algorithm
+SWEEPS = {
+    'simple': 'resolution',
+    'complex': 'step',
+}
+
+
+def run_case(model: str, algorithm: str, params: dict, repeat: int) -> dict:
+    """ Runs a case in this process: best time of every stage, peak RSS
+        (bytes) and exported model size (bytes) """
+    import resource
+    from batch import run_job
+
+    best = {}
+    with tempfile.TemporaryDirectory() as output:
+        for _ in range(repeat):
+            record = run_job(model, f'algorithms.{algorithm}', params, output, 'native', False)
+            if record['status'] != 'ok':
+                raise RuntimeError(record['error'])
+            for (stage, seconds) in record['timings'].items():
+                best[stage] = min(best.get(stage, seconds), seconds)
+        size = Path(record['result']).stat().st_size
+
+    # ru_maxrss is given in KiB on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {'timings': best, 'total': sum(best.values()),
+        'peak_rss': rss, 'output_bytes': size}
+
+
+def case_key(case: dict) -> tuple:
+    return (case['model'], case['algorithm'], json.dumps(case['params'], sort_keys=True))
+
+
+def git_commit() -> str | None:
+    try:
+        process = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True)
+        return process.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> None:
+    from tabulate import tabulate
+    values = {'simple': args.resolutions, 'complex': args.steps}
+    models = sorted(p for p in Path(args.models).iterdir() if p.is_dir())
+    cases, rows = [], []
+
+    for algorithm in args.algorithms:
+        param = SWEEPS[algorithm]
+        for path in models:
+            for value in values[algorithm]:
+                params = {param: value}
+                case = {'model': path.name, 'algorithm': algorithm, 'params': params}
+                command = [sys.executable, '-m', 'benchmarks.suite', 'case',
+                    str(path), algorithm, json.dumps(params), '-n', str(args.repeat)]
+                process = subprocess.run(command, capture_output=True, text=True)
+
+                if process.returncode:
+                    case['error'] = process.stderr.strip().splitlines()[-1]
+                else:
+                    case.update(json.loads(process.stdout.splitlines()[-1]))
+                cases.append(case)
+
+                timings = case.get('timings', {})
+                rows.append([path.name, algorithm, f'{param}={value}']
+                    + [f'{timings[s] * 1000:.2f}' if s in timings else '-' for s in STAGES]
+                    + [f'{case.get("peak_rss", 0) / 2**20:.1f}', case.get('output_bytes', '-'),
+                    case.get('error', 'ok')])
+                print(f'[+] {path.name} {algorithm} {param}={value}: {case.get("error", "ok")}',
+                    file=sys.stderr)
+
+    entry = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'label': args.label,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': args.repeat,
+        'cases': cases,
+    }
+    Path(args.history).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.history, 'a') as file:
+        file.write(json.dumps(entry) + '\n')
+
+    headers = ['Model', 'Algorithm', 'Params'] + [f'{s} (ms)' for s in STAGES] \
+        + ['Peak RSS (MiB)', 'Output (bytes)', 'Status']
+    print(tabulate(rows, headers=headers, tablefmt='github'))
+    print(f'[+] Run appended to {args.history}')
+
+
+def compare(args) -> bool:
+    """ Compares two runs of the history. Returns whether there are
+        regressions: a metric worse than threshold (relative), ignoring
+        times below min_ms """
+    from tabulate import tabulate
+    with open(args.history) as file:
+        runs = [json.loads(line) for line in file if line.strip()]
+    if len(runs) < 2:
+        sys.exit('[!] The history needs at least two runs')
+    base, head = runs[args.base], runs[args.head]
+    base_cases = {case_key(c): c for c in base['cases'] if 'error' not in c}
+
+    rows, regressions = [], 0
+    for case in head['cases']:
+        previous = base_cases.get(case_key(case))
+        if previous is None or 'error' in case:
+            continue
+
+        metrics = [('total', previous['total'] * 1000, case['total'] * 1000)]
+        metrics += [(s, previous['timings'][s] * 1000, case['timings'][s] * 1000)
+            for s in STAGES if s in case['timings'] and s in previous['timings']]
+        metrics += [('peak_rss', previous['peak_rss'], case['peak_rss']),
+            ('output_bytes', previous['output_bytes'], case['output_bytes'])]
+
+        for (metric, old, new) in metrics:
+            is_time = metric not in ('peak_rss', 'output_bytes')
+            if is_time and max(old, new) < args.min_ms: continue
+            change = (new - old) / old if old else 0.0
+            if change > args.threshold:
+                regressions += 1
+                params = ','.join(f'{k}={v}' for (k, v) in case['params'].items())
+                rows.append([case['model'], case['algorithm'], params, metric,
+                    f'{old:.2f}', f'{new:.2f}', f'{change:+.1%}'])
+
+    name = lambda r: f'{r["date"]} ({r.get("commit") or "?"}{", " + r["label"] if r.get("label") else ""})'
+    print(f'Base: {name(base)}\nHead: {name(head)}')
+    if rows:
+        headers = ['Model', 'Algorithm', 'Params', 'Metric', 'Base', 'Head', 'Change']
+        print(tabulate(rows, headers=headers, tablefmt='github'))
+    print(f'[+] {regressions} regressions over {args.threshold:.0%}')
+    return regressions > 0
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark suite of the reconstruction algorithms')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the suite, appending it to the history')
+    run_parser.add_argument('-m', '--models', type=str, default='models',
+        help='Directory with the models to benchmark')
+    run_parser.add_argument('-a', '--algorithms', type=str, nargs='+',
+        default=list(SWEEPS), choices=list(SWEEPS))
+    run_parser.add_argument('-r', '--resolutions', type=int, nargs='+', default=[16, 32, 64, 128],
+        help='Resolutions swept by the simple algorithm')
+    run_parser.add_argument('-s', '--steps', type=float, nargs='+', default=[4.0, 2.0, 1.0],
+        help='Steps swept by the complex algorithm')
+    run_parser.add_argument('-n', '--repeat', type=int, default=3,
+        help='Runs per case, the best time of every stage is kept')
+    run_parser.add_argument('-l', '--label', type=str, default=None,
+        help='Label stored with the run')
+    run_parser.add_argument('--history', type=str, default=HISTORY)
+
+    compare_parser = commands.add_parser('compare', help='Flag regressions between two runs')
+    compare_parser.add_argument('--base', type=int, default=-2,
+        help='Index of the base run in the history (default: the previous one)')
+    compare_parser.add_argument('--head', type=int, default=-1,
+        help='Index of the compared run in the history (default: the last one)')
+    compare_parser.add_argument('-t', '--threshold', type=float, default=0.1,
+        help='Relative change flagged as a regression')
+    compare_parser.add_argument('--min-ms', type=float, default=5.0,
+        help='Times below this are too noisy to be compared')
+    compare_parser.add_argument('--history', type=str, default=HISTORY)
+
+    case_parser = commands.add_parser('case', help='Run a single case (used by run)')
+    case_parser.add_argument('model', type=str)
+    case_parser.add_argument('algorithm', type=str, choices=list(SWEEPS))
+    case_parser.add_argument('params', type=json.loads)
+    case_parser.add_argument('-n', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'compare':
+        if compare(args): sys.exit(1)
+    else:
+        print(json.dumps(run_case(args.model, args.algorithm, args.params, args.repeat)))
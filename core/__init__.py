@@ -0,0 +1,2 @@
+# contour extraction backends of BaseView
+CONTOUR_BACKENDS = ('native', 'walker')
\ No newline at end of file
@@ -1,8 +1,14 @@
+from __future__ import annotations
 from abc import abstractmethod
-from tabulate import tabulate
+from typing import TYPE_CHECKING
 from core.base_view import BaseView
 from pathlib import Path
 import warnings
+import time
+import os
+
+if TYPE_CHECKING:
+    from core.view_cache import ViewCache
 
 
 class BaseModel:
@@ -11,13 +17,23 @@ class BaseModel:
     path: str
     bounds: tuple[float, float, float, float, float, float]
     print_info: bool
+    load_time: float
+    jobs: int
 
-    def __init__(self, path: str, viewClass: BaseView):
+    def __init__(self, path: str, viewClass: BaseView, contour: str = 'native',
+        cache: ViewCache | None = None, jobs: int = 1):
         """" Initializes a Model, loading all the available views """
-        self.views = [viewClass(f) for f in Path(path).iterdir() if f.is_dir()]
+        from core import profiler
+        jobs = jobs or os.cpu_count() or 1
+        start = time.perf_counter()
+        with profiler.stage('load_views', path=str(path), jobs=jobs):
+            self.views = self.load_views(path, viewClass, contour, cache, jobs)
+        self.load_time = time.perf_counter() - start
         self.path = path
+        self.jobs = jobs
 
         # Display all the model data in a table format
+        from tabulate import tabulate
         format = lambda p: f'({p[0]}, {p[1]}, {p[2]})'
         data = [[view.name, 
             format(view.origin),
@@ -30,6 +46,7 @@ class BaseModel:
         table = tabulate(data, headers=headers, tablefmt="github")
         name = 'A model has been found at: %s' % self.path
         print(f'{name}.\nThe views found of the model are:\n{table}')
+        print(f'Views loaded in {self.load_time * 1000:.2f} ms ({jobs} jobs)')
 
         # Calculate the 3D bounding box that contains the model
         # This is required for the model's rendering
@@ -42,7 +59,62 @@ class BaseModel:
             bounds[2] = max(bounds[2], view_bounds[2])
             bounds[3] = max(bounds[3], view_bounds[3])
         self.bounds = (bounds[0], bounds[2], bounds[1], bounds[3], bounds[1], bounds[3])
-       
+
+
+    @staticmethod
+    def load_views(path: str, viewClass: BaseView, contour: str,
+        cache: ViewCache | None, jobs: int) -> list[BaseView]:
+        """ Loads the views of a model, sorted by their directory name.
+            With more than one job, views are loaded in parallel. """
+        folders = sorted(f for f in Path(path).iterdir() if f.is_dir())
+        if min(jobs, len(folders)) <= 1:
+            return [BaseModel.load_view(viewClass, f, contour, cache) for f in folders]
+
+        from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+        from itertools import repeat
+        from core import profiler
+        parent = profiler.current()
+
+        # The native contour backend runs in OpenCV/NumPy code that releases
+        # the GIL, so threads are enough. The walker is pure Python.
+        if contour == 'native':
+            with ThreadPoolExecutor(max_workers=min(jobs, len(folders))) as executor:
+                return list(executor.map(BaseModel.load_view, repeat(viewClass),
+                    folders, repeat(contour), repeat(cache), repeat(parent)))
+
+        # worker processes return the stages of their views, merged here
+        with ProcessPoolExecutor(max_workers=min(jobs, len(folders))) as executor:
+            loaded = list(executor.map(BaseModel.load_view_process, repeat(viewClass),
+                folders, repeat(contour), repeat(cache), repeat(profiler.enabled())))
+        for (_, records) in loaded:
+            profiler.merge(records, parent)
+        return [view for (view, _) in loaded]
+
+
+    @staticmethod
+    def load_view(viewClass: BaseView, folder: Path, contour: str,
+        cache: ViewCache | None, parent: int | None = None) -> BaseView:
+        """ Loads a single view, profiled in the current stage of the
+            thread, or in parent (from a worker thread) """
+        from core import profiler
+        with profiler.stage('load_view', parent, view=folder.name):
+            view = viewClass(folder, contour, cache)
+            profiler.count(contour_vertices=len(view.polygon.exterior.coords) - 1)
+        return view
+
+
+    @staticmethod
+    def load_view_process(viewClass: BaseView, folder: Path, contour: str,
+        cache: ViewCache | None, profile: bool) -> tuple[BaseView, list[dict]]:
+        """ load_view in a worker process. If profile, the view is profiled
+            by a profiler of its own, whose stage records are returned """
+        from core import profiler
+        if not profile:
+            return BaseModel.load_view(viewClass, folder, contour, cache), []
+        profiler.ACTIVE = profiler.Profiler()
+        view = BaseModel.load_view(viewClass, folder, contour, cache)
+        return view, profiler.ACTIVE.records()
+
 
     @abstractmethod
     def initial_reconstruction(self) -> BaseModel:
@@ -71,6 +143,12 @@ class BaseModel:
         warnings.warn('This method has to be implemented')
 
 
+    @abstractmethod
+    def export_model(self, path: Path) -> None:
+        """ Must write the reconstructed model data to path (.npz) """
+        warnings.warn('This method has to be implemented')
+
+
     @abstractmethod
     def additional_info(self) -> None:
         """ Must print some additional information about the model """
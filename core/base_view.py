@@ -1,6 +1,9 @@
 import json
 from pathlib import Path
 from shapely.geometry import Polygon
+from core import CONTOUR_BACKENDS
+from core.view_cache import ViewCache
+from core import profiler
 import numpy as np
 import cv2
 
@@ -13,9 +16,13 @@ class BaseView:
     vz: np.ndarray
     name: str
     polygon: Polygon
+    transform_inv: np.ndarray
 
-    def __init__(self, path: Path):
+    def __init__(self, path: Path, contour: str = 'native', cache: ViewCache | None = None):
         """ Initializes Vx, Vy, Vz, O, given a path """
+        if contour not in CONTOUR_BACKENDS:
+            raise ValueError(f'Unknown contour backend: {contour}')
+
         camera_data = path.joinpath('camera.json')
         projection = path.joinpath('plane.bmp')
 
@@ -23,6 +30,21 @@ class BaseView:
             (not projection.is_file())):
             raise FileNotFoundError
 
+        # A cache hit skips the camera parsing and image decoding
+        if cache is not None:
+            digest = cache.digest(path)
+            entry = cache.load(digest)
+            profiler.count(cache_hits=entry is not None)
+            if entry is not None:
+                self.origin = entry['origin']
+                self.vx = entry['vx']
+                self.vy = entry['vy']
+                self.vz = entry['vz']
+                self.name = entry['name']
+                self.polygon = Polygon(entry['vertices'])
+                self.transform_inv = entry['transform_inv']
+                return
+
         with open(camera_data, 'r') as file:
             data = json.load(file)
             self.origin = np.array(data['origin'], dtype=float)
@@ -31,14 +53,18 @@ class BaseView:
             self.vz = np.array(data['vz'], dtype=float)
             self.name = data['name']
 
-        # Get the  object's projection contour lines
+        # Get the vertices from the object's projection contour
         img = cv2.imread(projection, cv2.IMREAD_GRAYSCALE)
-        _, img = cv2.threshold(img, 254, 255, cv2.THRESH_BINARY_INV)
-        laplacian = np.array([[-1,-1,-1],[-1,8,-1],[-1,-1,-1]])
-        img = cv2.filter2D(img, -1, laplacian) 
-
-        # Get the vertices from the contour lines
-        vertices = np.array(self.get_contour_polygon(img), dtype=float)
+        if contour == 'native':
+            vertices = self.get_contour_polygon_native(img)
+        else:
+            # reference mode: laplacian contour lines + pixel walk
+            _, img = cv2.threshold(img, 254, 255, cv2.THRESH_BINARY_INV)
+            laplacian = np.array([[-1,-1,-1],[-1,8,-1],[-1,-1,-1]])
+            img = cv2.filter2D(img, -1, laplacian)
+            vertices = self.get_contour_polygon(img)
+
+        vertices = np.array(vertices, dtype=float)
         min_vals, max_vals = np.min(vertices, axis=0), np.max(vertices, axis=0)
         center = (min_vals + max_vals) / 2
         self.polygon = Polygon(vertices - center)
@@ -49,6 +75,7 @@ class BaseView:
             [self.vx[1], self.vz[1]],
             [self.vx[2], self.vz[2]]], dtype=float)
         self.transform_inv = np.linalg.pinv(transform_matrix)
+        if cache is not None: cache.store(digest, self)
 
     
     def get_contour_polygon(self, img: np.ndarray) -> list[tuple[int, int]]:
@@ -90,6 +117,62 @@ class BaseView:
         return points
 
 
+    def get_contour_polygon_native(self, img: np.ndarray) -> list[tuple[int, int]]:
+        """ Same result as get_contour_polygon, but computed with bulk array
+            operations over the outline pixels instead of a pixel walk. """
+        # contour line pixels: object pixels with some empty 8-neighbour,
+        # exactly the pixels the laplacian filter keeps at 0xff
+        solid = (img < 0xff).view(np.uint8)
+        kernel = np.ones((3, 3), dtype=np.uint8)
+        inner = cv2.erode(solid, kernel, borderType=cv2.BORDER_CONSTANT, borderValue=1)
+        line = cv2.subtract(solid, inner)
+
+        height, width = line.shape
+        pixels = cv2.findNonZero(line)
+        if pixels is None:
+            raise ValueError('The projection does not contain any contour')
+        xs, zs = pixels[:, 0, 0], pixels[:, 0, 1]
+
+        # the walker cannot handle lines touching the image border
+        if (xs.min() == 0 or zs.min() == 0 or
+            xs.max() == width - 1 or zs.max() == height - 1):
+            return self.get_contour_polygon(line * 0xff)
+
+        # raster-ordered pixel indices, used to look up the 4-neighbours
+        index = zs.astype(np.int64) * width + xs
+        def contains(query: np.ndarray) -> np.ndarray:
+            found = np.minimum(np.searchsorted(index, query), len(index) - 1)
+            return index[found] == query
+
+        horz = contains(index - 1).astype(np.uint8) + contains(index + 1)
+        vert = contains(index - width).astype(np.uint8) + contains(index + width)
+
+        # lines with branches are resolved by the walker's priorities
+        if np.any(horz + vert != 2):
+            return self.get_contour_polygon(line * 0xff)
+
+        # vertices, in raster order. Every horizontal (vertical) run joins
+        # two consecutive vertices of the same row (column).
+        corner = (horz > 0) & (vert > 0)
+        cx, cz = xs[corner], zs[corner]
+        count = len(cx)
+        across = (np.arange(count) ^ 1).tolist()
+        column = np.lexsort((cz, cx))
+        along = np.empty(count, dtype=np.intp)
+        along[column] = column[np.arange(count) ^ 1]
+        along = along.tolist()
+
+        # The walk starts at the first vertex in raster order and moves
+        # right first, so runs alternate between horizontal and vertical
+        chain, i = [], 0
+        while True:
+            j = across[i]
+            chain += (i, j)
+            i = along[j]
+            if i == 0: break
+        return list(zip(cx[chain].tolist(), (-cz[chain]).tolist()))
+
+
     def plane_to_real(self, point: np.ndarray) -> np.ndarray:
         """ Converts a 2D point to a 3D point """
         u = self.vx * point[0]
@@ -102,3 +185,14 @@ class BaseView:
         delta = point - self.origin        
         solution = self.transform_inv @ delta
         return np.array([solution[0], solution[1]])
+
+
+    def plane_to_real_batch(self, points: np.ndarray) -> np.ndarray:
+        """ Vectorized version of view.plane_to_real (points = (n,2) -> (n,3)) """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        return self.origin + points[:, :1] * self.vx + points[:, 1:] * self.vz
+
+
+    def real_to_plane_batch(self, points: np.ndarray) -> np.ndarray:
+        """ Vectorized version of view.real_to_plane (points = (n,3) -> (n,2)) """
+        return (np.asarray(points, dtype=float) - self.origin) @ self.transform_inv.T
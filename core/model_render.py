@@ -1,9 +1,52 @@
 import pyray as rl
+import numpy as np
 import math
 import json
 import os
 from core.base_model import BaseModel
 
+# direction of the light used to shade uploaded meshes (render space)
+LIGHT = np.array([0.4, 1.0, 0.6]) / np.linalg.norm([0.4, 1.0, 0.6])
+
+
+def upload_mesh(vertices: np.ndarray, normals: np.ndarray, indices: np.ndarray) -> rl.Model:
+    """ Uploads a triangle mesh in model coordinates (z up) to the GPU, as
+        a single raylib model. Triangles must be counter-clockwise seen from
+        outside. Vertices are shaded once with a fixed directional light. """
+    # render space is (x, z, y): a mirror, so the winding is reversed
+    vertices = np.ascontiguousarray(vertices[:, [0, 2, 1]], dtype=np.float32)
+    normals = np.ascontiguousarray(normals[:, [0, 2, 1]], dtype=np.float32)
+    indices = np.ascontiguousarray(indices[:, ::-1])
+
+    # raylib indices are 16 bits wide, bigger meshes are not indexed
+    if len(vertices) > 0xffff:
+        vertices, normals = vertices[indices.ravel()], normals[indices.ravel()]
+        indices = None
+
+    shade = 0.45 + 0.55 * np.clip(normals @ LIGHT, 0, 1)
+    colors = np.empty((len(vertices), 4), dtype=np.uint8)
+    colors[:, :3] = (shade * 255)[:, np.newaxis]
+    colors[:, 3] = 255
+
+    def copy(array: np.ndarray, ctype: str):
+        # buffers owned by raylib, so that unloading the model frees them
+        pointer = rl.mem_alloc(array.nbytes)
+        rl.ffi.memmove(pointer, rl.ffi.from_buffer(array), array.nbytes)
+        return rl.ffi.cast(ctype, pointer)
+
+    mesh = rl.Mesh()
+    mesh.vertexCount = len(vertices)
+    mesh.vertices = copy(vertices, 'float *')
+    mesh.normals = copy(normals, 'float *')
+    mesh.colors = copy(colors, 'unsigned char *')
+    if indices is not None:
+        mesh.triangleCount = len(indices)
+        mesh.indices = copy(indices.astype(np.uint16), 'unsigned short *')
+    else:
+        mesh.triangleCount = len(vertices) // 3
+    rl.upload_mesh(mesh, False)
+    return rl.load_model_from_mesh(mesh)
+
 
 class ModelRender:
 
@@ -0,0 +1,239 @@
+from contextlib import contextmanager, nullcontext
+import threading
+import json
+import time
+import os
+
+NULL_STAGE = nullcontext()
+
+
+class Stage:
+
+    """ A profiled span of the run: wall and CPU time (seconds), peak traced
+        memory (bytes) and counters. Stages nest, per thread. """
+    name: str
+    args: dict
+    parent: int | None
+    thread: int
+    start: float
+    wall: float
+    cpu: float
+    peak: int
+    counters: dict[str, float]
+
+    def __init__(self, name: str, args: dict, parent: int | None, thread: int):
+        self.name = name
+        self.args = args
+        self.parent = parent
+        self.thread = thread
+        self.start = self.wall = self.cpu = 0.0
+        self.peak = 0
+        self.counters = {}
+
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'args': self.args,
+            'parent': self.parent,
+            'thread': self.thread,
+            'start': self.start,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'peak': self.peak,
+            'counters': self.counters,
+        }
+
+
+class Profiler:
+
+    """ Records the stages of a run. Memory is measured with tracemalloc,
+        which also traces the numpy buffers, so it is started here. CPU
+        time and the traced peak are process-wide: stages of worker threads
+        (opened with a parent stage of another thread) only record their
+        wall time and counters, their CPU time and memory go to the stage
+        that started the threads. Stages of worker processes are recorded
+        there and merged (see merge). """
+    stages: list[Stage]
+    origin: float
+    local: threading.local
+    lock: threading.Lock
+
+    def __init__(self):
+        import tracemalloc
+        self.stages = []
+        self.origin = time.perf_counter()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        if not tracemalloc.is_tracing(): tracemalloc.start()
+
+
+    @contextmanager
+    def stage(self, name: str, parent: int | None = None, **args):
+        """ Records a stage, nested in the innermost open stage of the
+            thread, or in parent (a stage index) if there is none """
+        import tracemalloc
+        stack = self.local.__dict__.setdefault('stack', [])
+        with self.lock:
+            index = len(self.stages)
+            stage = Stage(name, args, stack[-1] if stack else parent, threading.get_ident())
+            self.stages.append(stage)
+
+        if (self.stages[stack[0]] if stack else stage).parent is not None:
+            # worker thread: the process-wide measures belong to the parent
+            stack.append(index)
+            start = time.perf_counter()
+            try:
+                yield stage
+            finally:
+                stage.wall = time.perf_counter() - start
+                stage.start = start - self.origin
+                stack.pop()
+            return
+
+        # the parent keeps the peak reached until now, then it is reset
+        if stack: self.stages[stack[-1]].peak = max(
+            self.stages[stack[-1]].peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        stack.append(index)
+        start, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stage
+        finally:
+            stage.wall = time.perf_counter() - start
+            stage.cpu = time.process_time() - cpu
+            stage.start = start - self.origin
+            stage.peak = max(stage.peak, tracemalloc.get_traced_memory()[1])
+            stack.pop()
+            if stack: self.stages[stack[-1]].peak = max(
+                self.stages[stack[-1]].peak, stage.peak)
+
+
+    def count(self, **counters: float) -> None:
+        """ Adds the counters to the innermost open stage of the thread """
+        stack = self.local.__dict__.get('stack')
+        if not stack: return
+        totals = self.stages[stack[-1]].counters
+        for (name, value) in counters.items():
+            totals[name] = totals.get(name, 0) + value
+
+
+    def current(self) -> int | None:
+        """ Index of the innermost open stage of the thread, if any """
+        stack = self.local.__dict__.get('stack')
+        return stack[-1] if stack else None
+
+
+    def records(self) -> list[dict]:
+        """ Stages to merge into the profiler of another process: start
+            times are absolute (perf_counter is system-wide) and the thread
+            is the process id """
+        return [{**stage.to_dict(), 'start': stage.start + self.origin,
+            'thread': os.getpid()} for stage in self.stages]
+
+
+    def merge(self, records: list[dict], parent: int | None) -> None:
+        """ Adds the stages recorded by a worker process (see records),
+            their top stages nested in parent """
+        with self.lock:
+            offset = len(self.stages)
+            for record in records:
+                stage = Stage(record['name'], record['args'],
+                    parent if record['parent'] is None else offset + record['parent'],
+                    record['thread'])
+                stage.start = record['start'] - self.origin
+                stage.wall, stage.cpu, stage.peak = record['wall'], record['cpu'], record['peak']
+                stage.counters = record['counters']
+                self.stages.append(stage)
+
+
+    def summary(self) -> dict[str, dict]:
+        """ Totals per stage name """
+        totals = {}
+        for stage in self.stages:
+            total = totals.setdefault(stage.name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak': 0})
+            total['calls'] += 1
+            total['wall'] += stage.wall
+            total['cpu'] += stage.cpu
+            total['peak'] = max(total['peak'], stage.peak)
+        return totals
+
+
+    def export(self, path: str, format: str = 'json') -> None:
+        """ Writes the stages as JSON, or as a Chrome trace (chrome://tracing,
+            Perfetto) with times in microseconds """
+        if format == 'chrome':
+            events = [{
+                'name': stage.name,
+                'cat': 'stage',
+                'ph': 'X',
+                'ts': stage.start * 1e6,
+                'dur': stage.wall * 1e6,
+                'pid': os.getpid(),
+                'tid': stage.thread,
+                'args': {**stage.args, **stage.counters,
+                    'cpu_ms': stage.cpu * 1e3, 'peak_bytes': stage.peak},
+            } for stage in self.stages]
+            data = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        else:
+            data = {'stages': [s.to_dict() for s in self.stages], 'summary': self.summary()}
+
+        with open(path, 'w') as file:
+            json.dump(data, file, indent=1, default=str)
+
+
+class NullProfiler:
+
+    """ Disabled profiler: every call is a no-op """
+
+    def stage(self, name: str, parent: int | None = None, **args):
+        return NULL_STAGE
+
+
+    def count(self, **counters: float) -> None:
+        pass
+
+
+    def current(self) -> int | None:
+        return None
+
+
+    def merge(self, records: list[dict], parent: int | None) -> None:
+        pass
+
+
+# the profiler of the run, disabled unless enable() is called
+ACTIVE: Profiler | NullProfiler = NullProfiler()
+
+
+def enable() -> Profiler:
+    """ Starts profiling the run (in this process) """
+    global ACTIVE
+    if not isinstance(ACTIVE, Profiler):
+        ACTIVE = Profiler()
+    return ACTIVE
+
+
+def enabled() -> bool:
+    return isinstance(ACTIVE, Profiler)
+
+
+def stage(name: str, parent: int | None = None, **args):
+    """ Context manager profiling a stage of the run, nested in the current
+        stage of the thread, or in parent (see Profiler.stage) """
+    return ACTIVE.stage(name, parent, **args)
+
+
+def count(**counters: float) -> None:
+    """ Adds counters to the current stage """
+    ACTIVE.count(**counters)
+
+
+def current() -> int | None:
+    """ Index of the current stage of the thread, to nest worker stages """
+    return ACTIVE.current()
+
+
+def merge(records: list[dict], parent: int | None) -> None:
+    """ Adds the stages recorded by a worker process """
+    ACTIVE.merge(records, parent)
@@ -0,0 +1,132 @@
+from pathlib import Path
+import hashlib
+import threading
+import struct
+import os
+import numpy as np
+
+# entry layout: header | name (utf-8) | float64 data
+# data: origin, vx, vy, vz (4x3) | transform_inv (2x3) | vertices (n x 2)
+MAGIC = b'ORVC'
+VERSION = 1
+HEADER = struct.Struct('<4sHH16sI')
+DIGEST_SIZE = 16
+
+
+class ViewCache:
+
+    directory: Path
+    max_bytes: int
+    max_entries: int
+
+    def __init__(self, directory: str = '.cache/views',
+        max_bytes: int = 64 * 1024 * 1024, max_entries: int = 4096):
+        """ Initializes a cache of parsed views stored at directory """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+
+    @staticmethod
+    def digest(path: Path) -> bytes:
+        """ Hash of the view input files (camera data + projection) """
+        hasher = hashlib.sha256()
+        for name in ('camera.json', 'plane.bmp'):
+            data = path.joinpath(name).read_bytes()
+            hasher.update(len(data).to_bytes(8, 'little'))
+            hasher.update(data)
+        return hasher.digest()[:DIGEST_SIZE]
+
+
+    def entry_path(self, digest: bytes) -> Path:
+        return self.directory.joinpath(digest.hex() + '.bin')
+
+
+    def load(self, digest: bytes) -> dict | None:
+        """ Returns the cached view data for digest, or None if the entry is
+            missing, stale or corrupted. Hits are marked as recently used. """
+        entry = self.entry_path(digest)
+        try:
+            raw = entry.read_bytes()
+        except OSError:
+            return None
+
+        try:
+            magic, version, name_len, stored, count = HEADER.unpack_from(raw)
+            if magic != MAGIC or version != VERSION or stored != digest:
+                raise ValueError('Stale view cache entry')
+
+            offset = HEADER.size + name_len
+            name = raw[HEADER.size:offset].decode('utf-8')
+            data = np.frombuffer(raw, dtype='<f8', offset=offset)
+            if len(data) != 18 + 2 * count:
+                raise ValueError('Truncated view cache entry')
+        except (struct.error, ValueError, UnicodeDecodeError):
+            entry.unlink(missing_ok=True)
+            return None
+
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return {
+            'name': name,
+            'origin': data[0:3].copy(),
+            'vx': data[3:6].copy(),
+            'vy': data[6:9].copy(),
+            'vz': data[9:12].copy(),
+            'transform_inv': data[12:18].reshape(2, 3).copy(),
+            'vertices': data[18:].reshape(count, 2).copy(),
+        }
+
+
+    def store(self, digest: bytes, view) -> None:
+        """ Writes the parsed data of a view, then evicts the least
+            recently used entries over the cache limits """
+        vertices = np.asarray(view.polygon.exterior.coords, dtype='<f8')[:-1]
+        name = view.name.encode('utf-8')
+        data = np.concatenate([view.origin, view.vx, view.vy, view.vz,
+            view.transform_inv.ravel(), vertices.ravel()]).astype('<f8')
+        header = HEADER.pack(MAGIC, VERSION, len(name), digest, len(vertices))
+
+        # write to a temporary file first, so readers never see partial entries
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = self.entry_path(digest)
+        temp = entry.with_suffix(f'.{os.getpid()}-{threading.get_ident()}.tmp')
+        temp.write_bytes(header + name + data.tobytes())
+        os.replace(temp, entry)
+        self.evict()
+
+
+    def entries(self) -> list[tuple[float, int, Path]]:
+        """ (last use, size, path) of every entry, least recently used first """
+        if not self.directory.is_dir():
+            return []
+        entries = []
+        for entry in self.directory.glob('*.bin'):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        return sorted(entries)
+
+
+    def evict(self) -> None:
+        """ Removes least recently used entries until within limits """
+        entries = self.entries()
+        total = sum(size for (_, size, _) in entries)
+        count = len(entries)
+
+        for (_, size, entry) in entries:
+            if total <= self.max_bytes and count <= self.max_entries:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+            count -= 1
+
+
+    def clear(self) -> None:
+        """ Removes every entry of the cache """
+        for (_, _, entry) in self.entries():
+            entry.unlink(missing_ok=True)
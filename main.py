@@ -1,21 +1,22 @@
 import importlib
-import pkgutil
 from pathlib import Path
 
 
 def discover_algorithms():
-    """ auto-discover all algorithms in 'algorithms' directory"""
+    """ auto-discover all algorithms in 'algorithms' directory. Only their
+        metadata is read, the Model of an algorithm is imported when the
+        module's Model attribute is first accessed """
     algorithms_path = Path('algorithms')
     algorithms = {}
     
-    for _, name, ispkg in pkgutil.iter_modules([str(algorithms_path)]):
-        if ispkg and not name.startswith('_'):
+    for package in sorted(algorithms_path.iterdir()):
+        name = package.name
+        if package.joinpath('__init__.py').is_file() and not name.startswith('_'):
             try:
                 module = importlib.import_module(f'algorithms.{name}')
-                if hasattr(module, 'Model') and hasattr(module, 'ALGORITHM_NAME'):
+                if hasattr(module, 'ALGORITHM_NAME'):
                     algorithms[module.ALGORITHM_NAME] = {
                         'module': module,
-                        'Model': module.Model,
                         'params': getattr(module, 'ALGORITHM_PARAMS', {})
                     }
             except Exception as e:
@@ -27,7 +28,7 @@ if __name__ == '__main__':
     
     import sys
     from argparse import ArgumentParser
-    from core.model_render import ModelRender
+    from core import CONTOUR_BACKENDS
 
     algorithms = discover_algorithms()
     if not algorithms: sys.exit('[!] No algorithms found!')
@@ -41,28 +42,64 @@ if __name__ == '__main__':
         choices=list(algorithms.keys()))
     parser.add_argument('-i', '--info', action='store_true', 
         help='Print additional information')
+    parser.add_argument('-c', '--contour', type=str, default='native',
+        help='Contour extraction backend used to load the views',
+        choices=CONTOUR_BACKENDS)
+    parser.add_argument('--no-cache', action='store_true',
+        help='Do not read or write the parsed views cache')
+    parser.add_argument('--clear-cache', action='store_true',
+        help='Remove every entry of the parsed views cache before loading')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+        help='Number of workers (0 = one per CPU) of every parallel stage: view '
+            'loading, the shared storage carving of simple and the parallel '
+            'refinement of complex. Each stage runs its own pool, one at a time')
+    parser.add_argument('--profile', type=str, default=None,
+        help='Record the time and memory of every stage to this file')
+    parser.add_argument('--profile-format', type=str, default='json',
+        help='Format of the profile file', choices=['json', 'chrome'])
 
     # add the arguments for all loaded algorithms
     for algo_name, algo_info in algorithms.items():
         for (param_name, param_config) in algo_info['params'].items():
-            parser.add_argument(f'--{param_name}', type=param_config['type'],
+            # --memory-budget, with --memory_budget kept as an alias
+            flags = dict.fromkeys([f'--{param_name.replace("_", "-")}', f'--{param_name}'])
+            parser.add_argument(*flags, dest=param_name, type=param_config['type'],
                 required=param_config.get('required', False),
                 default=param_config.get('default'),
+                choices=param_config.get('choices'),
                 help=f'[{algo_name}] ' + param_config.get('help', 'No available info'))
     args = parser.parse_args()
 
+    from core import profiler
+    if args.profile: profiler.enable()
+
+    # parsed views cache, shared between runs
+    from core.view_cache import ViewCache
+    cache = ViewCache()
+    if args.clear_cache: cache.clear()
+    if args.no_cache: cache = None
+
     # build kwargs from algorithm parameters
-    model_kwargs = { 'path': args.path }
+    algo_info = algorithms[args.algorithm]
+    model_kwargs = { 'path': args.path, 'contour': args.contour, 'cache': cache, 'jobs': args.jobs }
     for param_name in algo_info['params'].keys():
         value = getattr(args, param_name, None)
         if value is not None: model_kwargs[param_name] = value
 
     # instantiate the model and build
-    ModelClass = algo_info['Model']
-    model = ModelClass(**model_kwargs).initial_reconstruction(
-        ).refine_model().generate_surface()    
+    ModelClass = algo_info['module'].Model
+    with profiler.stage('reconstruction', algorithm=args.algorithm):
+        model = ModelClass(**model_kwargs)
+        for stage in ('initial_reconstruction', 'refine_model', 'generate_surface'):
+            with profiler.stage(stage):
+                getattr(model, stage)()
     if args.info: model.additional_info()
 
+    if args.profile:
+        profiler.ACTIVE.export(args.profile, args.profile_format)
+        print(f'[+] Profile written to {args.profile}')
+
+    from core.model_render import ModelRender
     render = ModelRender(model)
     render.initialize()
     render.render_loop()
\ No newline at end of file
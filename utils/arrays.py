@@ -0,0 +1,8 @@
+import numpy as np
+
+
+def ragged_arange(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """ Concatenation of the ranges starts[i]:starts[i] + counts[i] """
+    counts = np.asarray(counts, dtype=np.int64)
+    firsts = np.repeat(np.asarray(starts, dtype=np.int64) - np.cumsum(counts) + counts, counts)
+    return firsts + np.arange(counts.sum())
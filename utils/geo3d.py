@@ -14,6 +14,13 @@ class Plane(Enum):
     XY = 0x1
     YZ = 0x2
 
+# indices of the two space axes spanned by each plane
+PLANE_AXES = {
+    Plane.XY: (0, 1),
+    Plane.XZ: (0, 2),
+    Plane.YZ: (1, 2),
+}
+
 
 def intersect_lines(p1, d1, p2, d2) -> np.ndarray:
     """ Intersects two 3D lines p1 + t*d1 & p2 + s*d2. """
@@ -22,6 +29,28 @@ def intersect_lines(p1, d1, p2, d2) -> np.ndarray:
     return p1 + ts[0] * d1
 
 
+def intersect_lines_batch(p1, d1, p2, d2) -> np.ndarray:
+    """ Vectorized version of intersect_lines, for broadcastable (..., 3)
+        arrays. Solves the normal equations of every least squares system
+        in closed form, (nearly) parallel lines take the minimum norm
+        solution as np.linalg.lstsq does """
+    p1, d1, p2, d2 = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (p1, d1, p2, d2)))
+    w = p2 - p1
+    a = np.einsum('...i,...i', d1, d1)
+    b = np.einsum('...i,...i', d1, d2)
+    c = np.einsum('...i,...i', d2, d2)
+    det = a * c - b * b
+
+    parallel = np.abs(det) <= 1e-12 * a * c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (c * np.einsum('...i,...i', d1, w) - b * np.einsum('...i,...i', d2, w)) / det
+
+    if parallel.any():
+        A = np.stack([d1[parallel], -d2[parallel]], axis=-1)
+        t[parallel] = (np.linalg.pinv(A) @ w[parallel][..., np.newaxis])[:, 0, 0]
+    return p1 + t[..., np.newaxis] * d1
+
+
 def point_on_plane(point, plane_normal, plane_point, tol= 1e-6) -> bool:
     """ Checks if a 3D point lies on a 3D plane """
     return abs(np.dot(plane_normal, point - plane_point)) < tol
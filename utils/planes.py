@@ -0,0 +1,161 @@
+from collections.abc import Callable
+import numpy as np
+import shapely
+
+
+def lift_rings(polygons: np.ndarray,
+    lift: Callable[[np.ndarray, np.ndarray], np.ndarray]) -> tuple:
+    """ Open rings of shapely polygons (in plane coordinates) lifted to 3D
+        by lift(polygon, points), given the polygon of every (n, 2) point.
+        Returns their vertices, ring offsets and polygon rings """
+    if not len(polygons):
+        return np.empty((0, 3)), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    _, coords, (offsets, rings) = shapely.to_ragged_array(polygons)
+
+    # the last vertex of every ring repeats the first one
+    keep = np.ones(len(coords), dtype=bool)
+    keep[offsets[1:] - 1] = False
+    sizes = np.diff(offsets) - 1
+    polygon = np.repeat(np.repeat(np.arange(len(polygons)), np.diff(rings)), sizes)
+    return lift(polygon, coords[keep]), np.concatenate([[0], np.cumsum(sizes)]), rings
+
+
+class PlaneStore:
+
+    """ Polygons of the model planes as flat arrays. Ring i has the
+        vertices vertices[offsets[i]:offsets[i+1]] (not repeating the first
+        one), polygon j has the rings rings[j]:rings[j+1], its exterior and
+        then its holes, and lies on the plane plane_index[j]. Polygons are
+        sorted by plane, planes are sorted as they were found. Rings are
+        handed out as views of vertices. """
+    keys: np.ndarray
+    points: np.ndarray
+    normals: np.ndarray
+    vertices: np.ndarray
+    offsets: np.ndarray
+    rings: np.ndarray
+    plane_index: np.ndarray
+
+    def __init__(self, keys: np.ndarray, points: np.ndarray, normals: np.ndarray,
+        vertices: np.ndarray, offsets: np.ndarray, plane_index: np.ndarray,
+        rings: np.ndarray | None = None):
+        self.keys = np.asarray(keys, dtype=float)
+        self.points = np.asarray(points, dtype=float).reshape(-1, 3)
+        self.normals = np.asarray(normals, dtype=float).reshape(-1, 3)
+        self.vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.plane_index = np.asarray(plane_index, dtype=np.int64)
+        # without rings, every polygon is a single ring
+        self.rings = np.arange(len(self.plane_index) + 1) if rings is None \
+            else np.asarray(rings, dtype=np.int64)
+
+
+    @classmethod
+    def empty(cls) -> 'PlaneStore':
+        return cls(np.empty(0), np.empty((0, 3)), np.empty((0, 3)),
+            np.empty((0, 3)), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+
+    @classmethod
+    def from_polygons(cls, keys: np.ndarray, points: np.ndarray, normals: np.ndarray,
+        polygons: list[list]) -> 'PlaneStore':
+        """ Store of the polygons of every plane, given as lists of vertices """
+        sizes = [len(polygon) for plane in polygons for polygon in plane]
+        vertices = [v for plane in polygons for polygon in plane for v in polygon]
+        return cls(keys, points, normals, np.array(vertices, dtype=float),
+            np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]),
+            np.repeat(np.arange(len(polygons)), [len(plane) for plane in polygons]))
+
+
+    def with_polygons(self, vertices: np.ndarray, offsets: np.ndarray,
+        plane_index: np.ndarray, rings: np.ndarray | None = None) -> 'PlaneStore':
+        """ Store of the same planes with other polygons """
+        return PlaneStore(self.keys, self.points, self.normals,
+            vertices, offsets, plane_index, rings)
+
+
+    def slice(self, first: int, last: int) -> 'PlaneStore':
+        """ Store of the polygons first:last, their vertices are a view """
+        ring_start, ring_end = self.rings[first], self.rings[last]
+        start, end = self.offsets[ring_start], self.offsets[ring_end]
+        return self.with_polygons(self.vertices[start:end],
+            self.offsets[ring_start:ring_end + 1] - start,
+            self.plane_index[first:last], self.rings[first:last + 1] - ring_start)
+
+
+    def merge(self, parts: list['PlaneStore']) -> 'PlaneStore':
+        """ Store of the same planes with the polygons of the parts, in order """
+        if not parts:
+            return self.with_polygons(np.empty((0, 3)), np.zeros(1, dtype=np.int64),
+                np.empty(0, dtype=np.int64))
+        starts = np.cumsum([0] + [p.n_vertices for p in parts])
+        ring_starts = np.cumsum([0] + [p.n_rings for p in parts])
+        return self.with_polygons(np.concatenate([p.vertices for p in parts]),
+            np.concatenate([[0]] + [p.offsets[1:] + s for (p, s) in zip(parts, starts)]),
+            np.concatenate([p.plane_index for p in parts]),
+            np.concatenate([[0]] + [p.rings[1:] + s for (p, s) in zip(parts, ring_starts)]))
+
+
+    def chunks(self, count: int) -> list[tuple[int, int]]:
+        """ Splits the polygons into at most count (first, last) ranges of
+            whole planes, with about the same number of vertices """
+        if not self.n_polygons:
+            return []
+        boundaries = np.flatnonzero(np.diff(self.plane_index)) + 1
+        targets = self.n_vertices * np.arange(1, count) / count
+        vertices = self.offsets[self.rings[boundaries]]
+        cuts = boundaries[np.minimum(np.searchsorted(vertices, targets),
+            len(boundaries) - 1)] if len(boundaries) else []
+        cuts = np.unique(np.concatenate([[0], cuts, [self.n_polygons]])).astype(int).tolist()
+        return list(zip(cuts[:-1], cuts[1:]))
+
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+    @property
+    def n_polygons(self) -> int:
+        return len(self.plane_index)
+
+
+    @property
+    def n_rings(self) -> int:
+        return len(self.offsets) - 1
+
+
+    @property
+    def n_vertices(self) -> int:
+        return len(self.vertices)
+
+
+    @property
+    def sizes(self) -> np.ndarray:
+        """ Number of vertices of every ring """
+        return np.diff(self.offsets)
+
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.keys, self.points, self.normals,
+            self.vertices, self.offsets, self.rings, self.plane_index))
+
+
+    def polygon(self, i: int) -> np.ndarray:
+        """ (k, 3) view of the exterior vertices of a polygon """
+        ring = self.rings[i]
+        return self.vertices[self.offsets[ring]:self.offsets[ring + 1]]
+
+
+    def plane_polygons(self, plane: int) -> range:
+        """ Indices of the polygons of a plane """
+        first, last = np.searchsorted(self.plane_index, [plane, plane + 1])
+        return range(int(first), int(last))
+
+
+    def edges(self) -> tuple[np.ndarray, np.ndarray]:
+        """ Start and end vertices of every ring edge, (n, 3) each """
+        following = np.arange(1, self.n_vertices + 1)
+        closed = self.sizes > 0
+        following[self.offsets[1:][closed] - 1] = self.offsets[:-1][closed]
+        return self.vertices, self.vertices[following]